@@ -0,0 +1,356 @@
+"""
+HTTP load driver for the Flask app in main.py.
+
+    python -m benchmarks.synthetic_school --teachers 10 --students 500 --face-image face.jpg
+    python -m benchmarks.http_load run --users 32 --duration 60 --face-image face.jpg
+    python -m benchmarks.http_load compare before.json after.json
+
+By default requests go through Flask's in-process test client, so nothing
+listens on a port; pass --url http://127.0.0.1:5000 to drive a running
+server instead. Virtual users are split across scenarios by --mix:
+
+    morning_burst      student logs in, verifies a face capture, loads stats
+    dashboard_polling  teacher polls summary, lists and manual requests
+    offline_sync       student logs in and uploads queued offline captures
+
+Seed and drive with the same portrait (or set BENCH_FACE_IMAGE for both) so
+every capture matches the logged-in student and is written. Each capture
+gets a unique JPEG comment, so its bytes differ per request and the
+embedding cache cannot short-circuit detection and encoding.
+
+Per-endpoint p50/p95/p99 latency and throughput are printed and saved as
+JSON, along with how many verify/sync check-ins were actually marked.
+Set DB_BACKEND=sqlite (and SQLITE_PATH) for both the seeder and the driver
+to run without a MySQL server.
+"""
+import argparse
+import base64
+import datetime
+import http.cookiejar
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic_school import (
+    BENCH_PASSWORD, BENCH_LATITUDE, BENCH_LONGITUDE, BENCH_FACE_IMAGE, teacher_email, student_email
+)
+
+DEFAULT_MIX = "morning_burst=0.5,dashboard_polling=0.4,offline_sync=0.1"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class InProcessClient:
+    """Drives main.app through Flask's test client (no sockets)."""
+
+    def __init__(self):
+        from main import app
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self.client.open(path, method=method, json=json_body, data=form)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """Drives a running server over HTTP with a per-user cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            body = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    """Collects per-endpoint latencies from all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.outcomes = {}
+
+    def timed(self, client, label, method, path, **kwargs):
+        """Issues one request, records its latency and returns the response body (None on failure)."""
+        start = time.perf_counter()
+        try:
+            status, body = client.request(method, path, **kwargs)
+        except Exception:
+            status, body = None, None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples.setdefault(label, []).append(elapsed)
+            if status is None or status >= 400:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return body
+
+    def count(self, outcome, n=1):
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + n
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def capture_jpeg(face_image=None):
+    """JPEG bytes of the student capture (synthetic noise, which never matches, unless a photo is given)."""
+    if face_image:
+        with open(face_image, "rb") as f:
+            return f.read()
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+_capture_counter = itertools.count()
+
+
+def capture_data_url(jpeg):
+    """
+    Data URL of `jpeg` with a unique COM segment after the SOI marker: the
+    pixels (and so detection and encoding work) are unchanged, but every
+    capture has a new digest, like a real camera frame.
+    """
+    comment = f"bench-capture-{next(_capture_counter)}".encode()
+    segment = b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg[:2] + segment + jpeg[2:]).decode()
+
+
+def _marked(body):
+    try:
+        return bool(json.loads(body).get("success"))
+    except Exception:
+        return False
+
+
+def _student_login(client, recorder, rand, students):
+    """Logs in as a random synthetic student and returns their students.id (or None)."""
+    index = rand.randrange(students)
+    recorder.timed(client, "POST /login/student", "POST", "/login/student",
+                   form={"email": student_email(index), "password": BENCH_PASSWORD})
+    body = recorder.timed(client, "GET /api/get-student-id", "GET", "/api/get-student-id")
+    try:
+        return json.loads(body)["student_id"]
+    except Exception:
+        return None
+
+
+def morning_burst(client, recorder, rand, options):
+    _student_login(client, recorder, rand, options.students)
+    body = recorder.timed(client, "POST /api/verify-face", "POST", "/api/verify-face", json_body={
+        "image": capture_data_url(options.jpeg),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "latitude": BENCH_LATITUDE,
+        "longitude": BENCH_LONGITUDE,
+    })
+    recorder.count("verify_marked" if _marked(body) else "verify_not_marked")
+    recorder.timed(client, "GET /api/student-monthly-stats", "GET", "/api/student-monthly-stats")
+
+
+def dashboard_polling(client, recorder, rand, options):
+    recorder.timed(client, "GET /api/summary", "GET", "/api/summary")
+    recorder.timed(client, "GET /api/get-present-students", "GET", "/api/get-present-students?status=Present")
+    recorder.timed(client, "GET /api/get-present-students", "GET", "/api/get-present-students?status=Absent")
+    recorder.timed(client, "GET /api/manual-attendance-requests", "GET", "/api/manual-attendance-requests")
+    recorder.timed(client, "GET /api/alerts", "GET", "/api/alerts")
+
+
+def offline_sync(client, recorder, rand, options):
+    student_id = _student_login(client, recorder, rand, options.students)
+    now = datetime.datetime.utcnow()
+    records = [{
+        "student_id": student_id,
+        "timestamp": (now - datetime.timedelta(days=rand.randint(0, 6))).isoformat() + "Z",
+        "image": capture_data_url(options.jpeg),
+        "latitude": BENCH_LATITUDE,
+        "longitude": BENCH_LONGITUDE,
+    } for _ in range(options.sync_batch)]
+    body = recorder.timed(client, "POST /api/sync-attendance", "POST", "/api/sync-attendance", json_body=records)
+    try:
+        recorder.count("sync_marked", int(json.loads(body).get("synced_count", 0)))
+    except Exception:
+        pass
+
+
+SCENARIOS = {
+    "morning_burst": morning_burst,
+    "dashboard_polling": dashboard_polling,
+    "offline_sync": offline_sync,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def assign_scenarios(users, weights):
+    """Splits virtual users across scenarios proportionally to their weights."""
+    total = sum(weights.values())
+    assigned = []
+    for name, weight in weights.items():
+        assigned.extend([name] * int(round(users * weight / total)))
+    while len(assigned) < users:
+        assigned.append(max(weights, key=weights.get))
+    return assigned[:users]
+
+
+def virtual_user(index, scenario, options, recorder, deadline):
+    rand = random.Random(options.seed + index)
+    client = HttpClient(options.url) if options.url else InProcessClient()
+    if scenario == "dashboard_polling":
+        recorder.timed(client, "POST /login/teacher", "POST", "/login/teacher",
+                       form={"email": teacher_email(index % options.teachers), "password": BENCH_PASSWORD})
+    while time.monotonic() < deadline:
+        SCENARIOS[scenario](client, recorder, rand, options)
+        if options.think_time:
+            time.sleep(options.think_time)
+
+
+def run(options):
+    options.jpeg = capture_jpeg(options.face_image)
+    if not options.face_image:
+        print("No --face-image: captures are noise, so verify/sync only time the no-face path")
+    scenarios = assign_scenarios(options.users, parse_mix(options.mix))
+    recorder = Recorder()
+
+    started_at = datetime.datetime.now()
+    start = time.monotonic()
+    deadline = start + options.duration
+    threads = [
+        threading.Thread(target=virtual_user, args=(i, scenario, options, recorder, deadline), daemon=True)
+        for i, scenario in enumerate(scenarios)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    endpoints = {}
+    total_requests = 0
+    for label, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        total_requests += len(samples)
+        endpoints[label] = {
+            "count": len(samples),
+            "errors": recorder.errors.get(label, 0),
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "target": options.url or "in-process",
+        "config": {
+            "users": options.users, "duration_s": options.duration, "mix": options.mix,
+            "think_time_s": options.think_time, "sync_batch": options.sync_batch,
+            "teachers": options.teachers, "students": options.students,
+            "face_image": options.face_image,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "total_requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "endpoints": endpoints,
+        "outcomes": dict(sorted(recorder.outcomes.items())),
+    }
+
+    output = options.output or os.path.join(RESULTS_DIR, f"http-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'endpoint':<40} {'count':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, stats in endpoints.items():
+        print(f"{label:<40} {stats['count']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+    if recorder.outcomes:
+        print("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(recorder.outcomes.items())))
+    print(f"total {total_requests} requests, {report['throughput_rps']} req/s; saved {output}")
+    return report
+
+
+def compare(before_path, after_path):
+    """Prints per-endpoint p95 and throughput changes between two saved reports."""
+    with open(before_path) as f:
+        before = json.load(f)["endpoints"]
+    with open(after_path) as f:
+        after = json.load(f)["endpoints"]
+    print(f"{'endpoint':<40} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'rps before':>11} {'rps after':>10}")
+    for label in sorted(set(before) | set(after)):
+        b, a = before.get(label), after.get(label)
+        if not b or not a:
+            print(f"{label:<40} {'only in ' + ('after' if a else 'before'):>11}")
+            continue
+        change = (a["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100 if b["p95_ms"] else 0
+        print(f"{label:<40} {b['p95_ms']:>11} {a['p95_ms']:>10} {change:>7.1f}% "
+              f"{b['throughput_rps']:>11} {a['throughput_rps']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a load test")
+    run_parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    run_parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... (default: %(default)s)")
+    run_parser.add_argument("--think-time", type=float, default=0, help="seconds each user waits between iterations")
+    run_parser.add_argument("--sync-batch", type=int, default=3, help="records per offline sync upload")
+    run_parser.add_argument("--teachers", type=int, default=10, help="teachers seeded by synthetic_school")
+    run_parser.add_argument("--students", type=int, default=500, help="students seeded by synthetic_school")
+    run_parser.add_argument("--face-image", default=BENCH_FACE_IMAGE,
+                            help="JPEG sent as the face capture, the one the school was seeded with "
+                                 "(default: $BENCH_FACE_IMAGE, else synthetic noise)")
+    run_parser.add_argument("--url", help="base URL of a running server (default: in-process test client)")
+    run_parser.add_argument("--output", help="report path (default: benchmarks/results/http-<time>.json)")
+    run_parser.add_argument("--seed", type=int, default=1)
+
+    compare_parser = commands.add_parser("compare", help="compare two saved reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args.before, args.after)
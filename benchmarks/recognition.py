@@ -0,0 +1,299 @@
+"""
+Microbenchmarks for the face recognition pipeline.
+
+    python -m benchmarks.recognition record --face-image face.jpg
+    python -m benchmarks.recognition run --repeat 5 --output after.json
+    python -m benchmarks.recognition run --baseline before.json --max-regression 0.15
+    python -m benchmarks.recognition run --detectors hog,haar,dnn,hog@0.5
+
+`record` builds the fixture set from one portrait: every combination of
+FIXTURE_RESOLUTIONS, FIXTURE_FACE_COUNTS and FIXTURE_QUALITIES, written as
+JPEGs under benchmarks/fixtures/ with a manifest of their digests so later
+runs can check they time the same bytes. `run` times each stage of the path
+used by main.verify_face and modules/attendance.py:
+
+    decode         cv2.imdecode of the JPEG bytes
+    color_convert  BGR -> RGB
+    detect:<spec>  each detector backend from --detectors (see
+                   modules/detectors.py); faces found per backend are
+                   reported next to the expected count as an accuracy check
+    encode         face_recognition.face_encodings for the faces found by
+                   the first detector
+    match          modules.classroom.distance_matrix of one encoding
+                   against float32 gallery matrices (the layout of the
+                   shared gallery) of --gallery-sizes synthetic rows
+
+Medians, p95s and per-stage memory high-water marks (tracemalloc, measured
+in a separate untimed pass) are saved as JSON. With --baseline, the command
+exits non-zero when any stage median is more than --max-regression slower.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cv2
+import face_recognition
+import numpy as np
+
+from modules.classroom import distance_matrix
+from modules.detectors import create_detector
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FIXTURE_RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+FIXTURE_FACE_COUNTS = [1, 4, 16]
+FIXTURE_QUALITIES = [60, 90]
+DEFAULT_GALLERY_SIZES = [100, 1000, 10000, 100000]
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def compose_fixture(face, width, height, faces):
+    """Tiles `faces` copies of the portrait on a grey canvas of the given size."""
+    canvas = np.full((height, width, 3), 128, dtype=np.uint8)
+    columns = math.ceil(math.sqrt(faces))
+    rows = math.ceil(faces / columns)
+    cell_w, cell_h = width // columns, height // rows
+    scale = min(cell_w / face.shape[1], cell_h / face.shape[0])
+    tile = cv2.resize(face, (int(face.shape[1] * scale), int(face.shape[0] * scale)))
+    for i in range(faces):
+        x = (i % columns) * cell_w + (cell_w - tile.shape[1]) // 2
+        y = (i // columns) * cell_h + (cell_h - tile.shape[0]) // 2
+        canvas[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+    return canvas
+
+
+def record(face_image):
+    with open(face_image, "rb") as f:
+        source = f.read()
+    face = cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    if face is None:
+        sys.exit(f"Could not decode {face_image}")
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    fixtures = []
+    for width, height in FIXTURE_RESOLUTIONS:
+        for faces in FIXTURE_FACE_COUNTS:
+            canvas = compose_fixture(face, width, height, faces)
+            for quality in FIXTURE_QUALITIES:
+                jpeg = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                name = f"{width}x{height}-{faces}face-q{quality}.jpg"
+                with open(os.path.join(FIXTURES_DIR, name), "wb") as f:
+                    f.write(jpeg)
+                fixtures.append({
+                    "file": name, "width": width, "height": height, "faces": faces,
+                    "quality": quality, "bytes": len(jpeg), "sha256": _sha256(jpeg),
+                })
+
+    with open(os.path.join(FIXTURES_DIR, "manifest.json"), "w") as f:
+        json.dump({"source_sha256": _sha256(source), "fixtures": fixtures}, f, indent=2)
+    print(f"Recorded {len(fixtures)} fixtures in {FIXTURES_DIR}")
+
+
+def load_fixtures():
+    manifest_path = os.path.join(FIXTURES_DIR, "manifest.json")
+    if not os.path.exists(manifest_path):
+        sys.exit("No fixtures recorded; run 'python -m benchmarks.recognition record --face-image <photo>' first")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    for fixture in manifest["fixtures"]:
+        with open(os.path.join(FIXTURES_DIR, fixture["file"]), "rb") as f:
+            fixture["data"] = f.read()
+        if _sha256(fixture["data"]) != fixture["sha256"]:
+            sys.exit(f"Fixture {fixture['file']} does not match its manifest digest; re-record")
+    return manifest
+
+
+def synthetic_gallery(size, seed=0):
+    """Gallery shaped like the shared gallery in modules/gallery.py: a (size, 128) float32 matrix."""
+    return np.random.default_rng(seed).normal(0.0, 0.09, (size, 128)).astype(np.float32)
+
+
+def _run_stages(data, detectors):
+    """Times one pass of the pipeline; returns ({stage: seconds}, encodings, {detector: faces})."""
+    timings = {}
+    detected = {}
+
+    start = time.perf_counter()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    timings["color_convert"] = time.perf_counter() - start
+
+    locations = None
+    for spec, detector in detectors.items():
+        start = time.perf_counter()
+        found = detector(rgb)
+        timings[f"detect:{spec}"] = time.perf_counter() - start
+        detected[spec] = len(found)
+        if locations is None:
+            locations = found
+
+    start = time.perf_counter()
+    encodings = face_recognition.face_encodings(rgb, locations)
+    timings["encode"] = time.perf_counter() - start
+
+    return timings, encodings, detected
+
+
+def _stage_memory(data, galleries, detectors):
+    """Peak traced allocation (bytes) per stage, in a separate untimed pass."""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        peaks["decode"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        peaks["color_convert"] = tracemalloc.get_traced_memory()[1]
+        locations = None
+        for spec, detector in detectors.items():
+            tracemalloc.reset_peak()
+            found = detector(rgb)
+            peaks[f"detect:{spec}"] = tracemalloc.get_traced_memory()[1]
+            if locations is None:
+                locations = found
+        tracemalloc.reset_peak()
+        encodings = face_recognition.face_encodings(rgb, locations)
+        peaks["encode"] = tracemalloc.get_traced_memory()[1]
+        if encodings:
+            for size, gallery in galleries.items():
+                tracemalloc.reset_peak()
+                distance_matrix(encodings[:1], gallery)
+                peaks[f"match@{size}"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    p95 = ordered[max(math.ceil(0.95 * len(ordered)) - 1, 0)]
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def run(options):
+    manifest = load_fixtures()
+    galleries = {size: synthetic_gallery(size) for size in options.gallery_sizes}
+    detectors = {spec: create_detector(spec) for spec in options.detectors}
+    probe = np.random.default_rng(1).normal(0.0, 0.09, (1, 128)).astype(np.float32)
+
+    results = {}
+    for fixture in manifest["fixtures"]:
+        samples = {}
+        detected = {}
+        for _ in range(options.repeat):
+            timings, encodings, detected = _run_stages(fixture["data"], detectors)
+            for stage, seconds in timings.items():
+                samples.setdefault(stage, []).append(seconds)
+        stages = {stage: _summary(values) for stage, values in samples.items()}
+        results[fixture["file"]] = {
+            "faces_expected": fixture["faces"],
+            "faces_detected": detected,
+            "stages": stages,
+            "memory_peak_bytes": _stage_memory(fixture["data"], galleries, detectors),
+        }
+        faces = " ".join(f"{spec}={count}" for spec, count in detected.items())
+        print(f"{fixture['file']:<28} faces {faces} of {fixture['faces']}  " + "  ".join(
+            f"{stage} {stats['median_ms']}ms" for stage, stats in stages.items()))
+
+    # Matching cost depends only on gallery size, so it is timed once per size
+    match = {}
+    for size, gallery in galleries.items():
+        samples = []
+        for _ in range(options.repeat):
+            start = time.perf_counter()
+            distance_matrix(probe, gallery)
+            samples.append(time.perf_counter() - start)
+        match[str(size)] = _summary(samples)
+        print(f"match gallery={size:<8} {match[str(size)]['median_ms']}ms")
+
+    report = {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "source_sha256": manifest["source_sha256"],
+        "repeat": options.repeat,
+        "fixtures": results,
+        "match": match,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    output = options.output or os.path.join(
+        RESULTS_DIR, f"recognition-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"max RSS {report['max_rss_kb']} KB; saved {output}")
+
+    if options.baseline:
+        regressions = find_regressions(options.baseline, report, options.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+def find_regressions(baseline_path, report, max_regression):
+    """Stage medians that got more than `max_regression` (a fraction) slower than the baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("source_sha256") != report["source_sha256"]:
+        print("warning: baseline was recorded from different fixtures")
+
+    regressions = []
+
+    def check(label, before, after):
+        if before["median_ms"] > 0 and after["median_ms"] > before["median_ms"] * (1 + max_regression):
+            regressions.append(f"{label}: {before['median_ms']}ms -> {after['median_ms']}ms")
+
+    for name, result in report["fixtures"].items():
+        old = baseline.get("fixtures", {}).get(name)
+        if not old:
+            continue
+        for stage, stats in result["stages"].items():
+            if stage in old["stages"]:
+                check(f"{name} {stage}", old["stages"][stage], stats)
+    for size, stats in report["match"].items():
+        if size in baseline.get("match", {}):
+            check(f"match gallery={size}", baseline["match"][size], stats)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="build the fixture set from a portrait photo")
+    record_parser.add_argument("--face-image", required=True)
+
+    run_parser = commands.add_parser("run", help="time every pipeline stage on the recorded fixtures")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--gallery-sizes", type=lambda v: [int(x) for x in v.split(",")],
+                            default=DEFAULT_GALLERY_SIZES, help="comma separated (default: 100,1000,10000,100000)")
+    run_parser.add_argument("--detectors", type=lambda v: v.split(","), default=["hog"],
+                            help="comma separated detector specs to compare, first one feeds encode (default: hog)")
+    run_parser.add_argument("--output", help="report path (default: benchmarks/results/recognition-<time>.json)")
+    run_parser.add_argument("--baseline", help="earlier report to check for regressions")
+    run_parser.add_argument("--max-regression", type=float, default=0.15,
+                            help="allowed slowdown of a stage median as a fraction (default: 0.15)")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.face_image)
+    else:
+        run(args)
@@ -0,0 +1,183 @@
+"""
+Seeds a synthetic school for load benchmarks.
+
+    python -m benchmarks.synthetic_school --teachers 20 --students 2000 --days 60 --face-image face.jpg
+
+Creates teachers (each owning one class), students and `--days` of
+attendance history, then rebuilds the monthly rollups. With --face-image
+(or BENCH_FACE_IMAGE) every student's stored encoding is that portrait's
+encoding plus a little jitter, well inside the match threshold, so the
+captures sent by benchmarks.http_load are detected, matched and marked.
+Without it the encodings are random and check-ins never match. Every account uses BENCH_PASSWORD. Point DB_NAME at a dedicated
+database and recreate it between seeds: accounts are inserted with INSERT
+IGNORE, but re-running appends another copy of the attendance history.
+"""
+import argparse
+import datetime
+import os
+import pickle
+import random
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+from modules.database import get_db_connection, create_tables
+from modules.rollup import refresh_monthly_rollup
+
+BENCH_PASSWORD = "bench-password"
+BENCH_FACE_IMAGE = os.getenv("BENCH_FACE_IMAGE")  # portrait shared by the seeder and the load driver
+ENCODING_JITTER = 0.005  # per dimension; ~0.06 from the probe, far below MATCH_THRESHOLD
+BENCH_LATITUDE = 28.6139
+BENCH_LONGITUDE = 77.2090
+INSERT_BATCH = 1000
+
+
+def teacher_email(i):
+    return f"bench-teacher-{i}@example.test"
+
+
+def student_email(i):
+    return f"bench-student-{i}@example.test"
+
+
+def enrollment_no(i):
+    return f"BENCH{i:06d}"
+
+
+def synthetic_encoding(rng, base=None):
+    """
+    `base` plus small jitter, or without a base a random vector with roughly
+    the scale of a dlib face encoding.
+    """
+    if base is None:
+        return rng.normal(0.0, 0.09, 128).astype(np.float64)
+    return (base + rng.normal(0.0, ENCODING_JITTER, 128)).astype(np.float64)
+
+
+def probe_encoding(face_image):
+    """Encoding of the benchmark portrait as verify-face computes it."""
+    # Imported lazily so seeding without a portrait needs no face libraries
+    from modules.embedding_cache import encode_image_bytes
+    with open(face_image, "rb") as f:
+        encoding = encode_image_bytes(f.read(), path="verify")
+    if encoding is None:
+        raise SystemExit(f"No face found in {face_image}")
+    return np.asarray(encoding, dtype=np.float64)
+
+
+def _batches(rows, size=INSERT_BATCH):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def seed(teachers, students, days, present_rate=0.85, seed_value=42, face_image=None):
+    rng = np.random.default_rng(seed_value)
+    base_encoding = probe_encoding(face_image) if face_image else None
+    if base_encoding is None:
+        print("No --face-image: seeding random encodings, so benchmark check-ins will not match")
+    rand = random.Random(seed_value)
+    # Hashing is deliberately slow; every synthetic account shares one hash
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    create_tables()
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        teacher_rows = [
+            ("Bench", f"Teacher{i}", teacher_email(i), password_hash, "Bench School",
+             BENCH_LATITUDE + rand.uniform(-0.0002, 0.0002), BENCH_LONGITUDE + rand.uniform(-0.0002, 0.0002))
+            for i in range(teachers)
+        ]
+        cursor.executemany("""
+            INSERT IGNORE INTO teachers (first_name, last_name, email, password, school_name, latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, teacher_rows)
+
+        for batch in _batches(list(range(students))):
+            cursor.executemany("""
+                INSERT IGNORE INTO students (first_name, last_name, email, password, student_id, face_encoding)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, [
+                ("Bench", f"Student{i}", student_email(i), password_hash, enrollment_no(i),
+                 pickle.dumps(synthetic_encoding(rng, base_encoding)))
+                for i in batch
+            ])
+        db.commit()
+
+        cursor.execute("SELECT id FROM teachers WHERE email LIKE %s ORDER BY id", ("bench-teacher-%",))
+        teacher_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT id, student_id, first_name, last_name FROM students WHERE student_id LIKE %s ORDER BY id",
+            ("BENCH%",)
+        )
+        student_rows = cursor.fetchall()
+
+        # One class per teacher, students split round-robin
+        for teacher_id in teacher_ids:
+            cursor.execute(
+                "INSERT IGNORE INTO classes (teacher_id, name, section) VALUES (%s, %s, %s)",
+                (teacher_id, "Bench", "A")
+            )
+        db.commit()
+        cursor.execute(
+            "SELECT c.id FROM classes c JOIN teachers t ON t.id = c.teacher_id WHERE t.email LIKE %s ORDER BY t.id",
+            ("bench-teacher-%",)
+        )
+        class_ids = [row[0] for row in cursor.fetchall()]
+        if class_ids:
+            for batch in _batches(student_rows):
+                cursor.executemany(
+                    "INSERT IGNORE INTO class_enrollments (class_id, student_id) VALUES (%s, %s)",
+                    [(class_ids[row[0] % len(class_ids)], row[0]) for row in batch]
+                )
+            db.commit()
+
+        # Attendance history on weekdays, excluding today so benchmarks start from an empty day
+        today = datetime.date.today()
+        months = set()
+        attendance_rows = []
+        for offset in range(days, 0, -1):
+            day = today - datetime.timedelta(days=offset)
+            if day.weekday() >= 5:
+                continue
+            months.add((day.year, day.month))
+            for db_id, enrollment, first_name, last_name in student_rows:
+                status = "Present" if rand.random() < present_rate else "Absent"
+                marked_at = datetime.datetime.combine(day, datetime.time(8, 0)) + datetime.timedelta(seconds=rand.randint(0, 5400))
+                attendance_rows.append((db_id, enrollment, f"{first_name} {last_name}", status, marked_at))
+            if len(attendance_rows) >= INSERT_BATCH * 10:
+                _insert_attendance(cursor, attendance_rows)
+                db.commit()
+                attendance_rows = []
+        _insert_attendance(cursor, attendance_rows)
+        db.commit()
+
+        for year, month in sorted(months):
+            refresh_monthly_rollup(cursor, day=datetime.date(year, month, 1))
+            db.commit()
+    finally:
+        cursor.close()
+        db.close()
+
+    print(f"Seeded {teachers} teachers, {students} students, {days} days of history")
+
+
+def _insert_attendance(cursor, rows):
+    for batch in _batches(rows):
+        cursor.executemany("""
+            INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
+            VALUES (%s, %s, %s, %s, %s)
+        """, batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--days", type=int, default=30, help="days of attendance history before today")
+    parser.add_argument("--present-rate", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--face-image", default=BENCH_FACE_IMAGE,
+                        help="portrait whose encoding every student gets (default: $BENCH_FACE_IMAGE)")
+    args = parser.parse_args()
+    seed(args.teachers, args.students, args.days, args.present_rate, args.seed, args.face_image)
@@ -1,20 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, jsonify, g
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-from modules.database import get_db_connection, create_tables
+from modules.database import get_db_connection, create_tables, ATTENDANCE_PARTITIONING, partition_maintenance_loop
 from modules.register import get_face_encoding
+from modules.embedding_cache import encode_image_bytes, embedding_cache_stats
+from modules.rollup import (
+    refresh_monthly_rollup, get_month_present_days, get_monthly_history,
+    get_cached_student_stats, set_cached_student_stats
+)
+from modules.bulk_marking import bulk_mark_status, BULK_STATUSES
+from modules.classes import teacher_roster_filter, teacher_has_classes, get_geofence_teachers
+from modules.spool import ATTENDANCE_SPOOL, spool_attendance, spool_flush_loop, spool_stats
+from modules.realtime import (
+    socketio_options, queue_alert, queue_attendance_delta, notify_attendance, flush_loop, WHOLE_SCHOOL_ROOM
+)
+from modules.gallery import get_gallery, set_student_templates, snapshot_loop, save_snapshot_on_exit
+from modules.classroom import decode_photo, roster_templates, recognize_photos, MAX_CLASSROOM_PHOTOS
+from modules.templates import (
+    student_templates, min_template_distance, queue_template_candidate, template_learn_loop, MATCH_THRESHOLD
+)
+from modules.versions import etag_for, bump, bump_for_students, bump_school
+from modules.leader import run_as_leader, is_leader
+from modules.checkin_cache import student_identity, student_by_enrollment_no, geofence_teachers
+from modules.checkin_cache import forget as forget_cached
+from modules.queries import fetch_all, fetch_one, fetch_value, execute_write, query_stats
+from modules.manual_requests import (
+    create_manual_request, resolve_manual_requests, MANUAL_REQUEST_ACTIONS, MAX_RESOLVE_BATCH
+)
 from flask_socketio import SocketIO, emit, join_room
 import datetime
-import face_recognition
 import base64
-import cv2
 import numpy as np
 import pickle
 import math
+import json
+import gzip
+import atexit
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options())
+# Started at import so workers run by a WSGI server flush their events too
+socketio.start_background_task(flush_loop, socketio)
+if ATTENDANCE_SPOOL:
+    socketio.start_background_task(spool_flush_loop, sleep=socketio.sleep)
+socketio.start_background_task(template_learn_loop, sleep=socketio.sleep)
+# Once-per-host upkeep runs in whichever worker holds its leader lock
+SNAPSHOT_LEADER = "gallery-snapshot"
+socketio.start_background_task(run_as_leader, SNAPSHOT_LEADER, snapshot_loop, sleep=socketio.sleep)
+if ATTENDANCE_PARTITIONING:
+    socketio.start_background_task(
+        run_as_leader, "partition-maintenance", partition_maintenance_loop, sleep=socketio.sleep
+    )
+
+def save_snapshot_if_leader():
+    """atexit hook: the worker that ran the snapshot loop writes the final snapshot."""
+    if is_leader(SNAPSHOT_LEADER):
+        save_snapshot_on_exit()
+
+atexit.register(save_snapshot_if_leader)
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
@@ -50,6 +94,23 @@ def teacher_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def request_roster_filter(cursor, column="s.id"):
+    """
+    Roster filter for the logged-in teacher, honouring optional class_id/class_name query args.
+    Views filter several columns; the teacher's has-classes check runs once per request.
+    """
+    class_id = request.args.get('class_id', type=int)
+    class_name = request.args.get('class_name') or None
+    has_classes = None
+    if class_id is None and class_name is None:
+        if 'teacher_has_classes' not in g:
+            g.teacher_has_classes = teacher_has_classes(cursor, session['user']['id'])
+        has_classes = g.teacher_has_classes
+    return teacher_roster_filter(
+        cursor, session['user']['id'], class_id=class_id, class_name=class_name,
+        column=column, has_classes=has_classes
+    )
+
 def student_required(f):
     """Decorator to restrict access to student users."""
     @wraps(f)
@@ -63,6 +124,75 @@ def student_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def conditional_json(scopes):
+    """
+    Decorator (below the auth decorator) for polled JSON views: the ETag is
+    built from the attendance versions of scopes() before the view runs, so an
+    unchanged poll gets a 304 without querying the DB. The view finds it in
+    g.etag, to key any cache it uses. Views opt a response out with
+    Cache-Control: no-store.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                etag = etag_for(*scopes())
+            except Exception as e:
+                print(f"Error reading attendance versions: {e}")
+                return f(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                g.etag = etag
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.cache_control.no_store:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def teacher_scopes():
+    return (f"teacher-{session['user']['id']}",)
+
+def student_scopes():
+    return (f"student-{session['user']['id']}",)
+
+GZIP_MIN_SIZE = 1024  # bytes; smaller JSON bodies are not worth compressing
+
+@app.after_request
+def gzip_json_response(response):
+    """Gzips large JSON responses for clients that accept it."""
+    if response.status_code != 200 or response.mimetype != 'application/json' or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', '').lower() or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) >= GZIP_MIN_SIZE:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@socketio.on('connect')
+def join_dashboard_rooms():
+    """Puts a teacher's dashboard socket in the rooms its events are queued for."""
+    user = session.get('user')
+    if not user or user.get('role') != 'teacher':
+        return
+    join_room(user['id'])
+    try:
+        db = get_db_connection()
+        cursor = db.cursor(buffered=True)
+        if not teacher_has_classes(cursor, user['id']):
+            join_room(WHOLE_SCHOOL_ROOM)
+    except Exception as e:
+        print(f"Error joining dashboard rooms: {e}")
+    finally:
+        if 'cursor' in locals(): cursor.close()
+        if 'db' in locals(): db.close()
+
 @app.route("/")
 def index():
     """Redirects to the appropriate dashboard if a user is logged in, otherwise to the auth page."""
@@ -97,11 +227,7 @@ def register_teacher():
 
     try:
         db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("""
-            INSERT INTO teachers (first_name, last_name, email, password, school_name)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (first_name, last_name, email, hashed_password, school_name))
+        execute_write(db, "teacher.insert", (first_name, last_name, email, hashed_password, school_name))
         db.commit()
         flash("Teacher registered successfully!", "success")
         return redirect(url_for("auth"))
@@ -109,7 +235,6 @@ def register_teacher():
         flash(f"Error: {e}", "danger")
         return redirect(url_for("auth"))
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
 # Student registration route
@@ -151,19 +276,19 @@ def register_student():
 
     try:
         db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("""
-            INSERT INTO students (first_name, last_name, email, password, student_id, face_data, face_encoding)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (first_name, last_name, email, hashed_password, student_id, face_data_to_save, face_encoding_bytes))
+        _, new_id = execute_write(db, "student.insert", (
+            first_name, last_name, email, hashed_password, student_id, face_data_to_save, face_encoding_bytes
+        ))
         db.commit()
+        bump_school()
+        if face_encoding is not None:
+            set_student_templates(new_id, [face_encoding])
         flash("Student registered successfully!", "success")
         return redirect(url_for("auth"))
     except Exception as e:
         flash(f"Error: {e}", "danger")
         return redirect(url_for("auth"))
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
 # Teacher login route
@@ -179,9 +304,7 @@ def login_teacher():
             return redirect(url_for("auth"))
 
         db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM teachers WHERE email=%s", (email,))
-        user = cursor.fetchone()
+        user = fetch_one(db, "teacher.login", (email,), dict_rows=True)
 
         if not user or not check_password_hash(user["password"], password):
             flash("Incorrect email or password!", "danger")
@@ -200,7 +323,6 @@ def login_teacher():
         flash("An error occurred during login", "danger")
         return redirect(url_for("auth"))
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
 # Student login route
@@ -211,17 +333,20 @@ def login_student():
     password = request.form.get("password")
 
     db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM students WHERE email=%s", (email,))
-    user = cursor.fetchone()
-    cursor.close()
-    db.close()
+    try:
+        user = fetch_one(db, "student.login", (email,), dict_rows=True)
+    finally:
+        db.close()
 
     if not user or not check_password_hash(user["password"], password):
         flash("Incorrect email or password!", "danger")
         return redirect(url_for("auth"))
 
-    session["user"] = {"id": user["id"], "role": "student", "name": user["first_name"]}
+    session["user"] = {
+        "id": user["id"], "role": "student", "name": user["first_name"],
+        # Lets a spooled check-in record the student without a DB lookup
+        "enrollment_no": user["student_id"], "full_name": f"{user['first_name']} {user['last_name']}"
+    }
     flash("Logged in successfully!", "success")
     return redirect(url_for("student_dashboard"))
 
@@ -238,35 +363,20 @@ def dashboard():
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
     try:
+        roster_sql, roster_params = request_roster_filter(cursor)
+        attendance_roster_sql, _ = request_roster_filter(cursor, column="a.student_id")
+
         # Get total number of students
-        cursor.execute("SELECT COUNT(*) as total FROM students")
-        total_students_result = cursor.fetchone()
-        total_students = total_students_result['total'] if total_students_result else 0
+        total_students = fetch_value(db, "roster.total", roster_params, roster=roster_sql) or 0
 
         # Get number of present students today
-        cursor.execute("""
-            SELECT COUNT(DISTINCT student_id) as present
-            FROM attendance
-            WHERE DATE(marked_at) = CURDATE()
-            AND status = 'Present'
-        """)
-        present_today_result = cursor.fetchone()
-        present_today = present_today_result['present'] if present_today_result else 0
+        present_today = fetch_value(db, "roster.present_today", roster_params, roster=attendance_roster_sql) or 0
         
         # Calculate attendance percentage
         attendance_percentage = (present_today / total_students * 100) if total_students > 0 else 0
         
         # Get recent attendance records
-        cursor.execute("""
-            SELECT CONCAT(s.first_name, ' ', s.last_name) as name, s.student_id as enrollment_no,
-            a.status, a.marked_at as timestamp
-            FROM attendance a
-            JOIN students s ON a.student_id = s.id
-            WHERE DATE(a.marked_at) = CURDATE()
-            ORDER BY a.marked_at DESC
-            LIMIT 5
-        """)
-        recent_records = cursor.fetchall()
+        recent_records = fetch_all(db, "roster.recent_today", roster_params, dict_rows=True, roster=roster_sql)
         
         return render_template(
             "dashboard.html",
@@ -312,41 +422,25 @@ def verify_face():
         user = session.get('user')
         student_id = user.get('id')
 
-        # Decode the base64 image
+        # Decode the base64 image and get the face encoding (cached for retried uploads)
         image_data = base64.b64decode(image_data_url.split(',')[1])
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        # Get the face encoding of the captured image
-        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        face_encodings = face_recognition.face_encodings(rgb_img)
-        if not face_encodings:
+        captured_face_encoding = encode_image_bytes(image_data)
+        if captured_face_encoding is None:
             return jsonify({'success': False, 'error': 'No face detected in the captured image.'})
-        captured_face_encoding = face_encodings[0]
-
-        # Get the student's stored face encoding
-        db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute("SELECT face_encoding FROM students WHERE id = %s", (student_id,))
-        student = cursor.fetchone()
-
-        if not student:
-            return jsonify({'success': False, 'error': 'Student not found.'})
 
-        if 'face_encoding' not in student or student['face_encoding'] is None:
+        # Get the student's stored face templates; with the spool on, nothing
+        # below touches the DB unless a cache misses
+        templates = student_templates(student_id)
+        if templates is None:
             return jsonify({'success': False, 'error': 'No face data registered for this student.'})
-
-        stored_face_encoding = pickle.loads(student['face_encoding'])
         
-        # Compare faces with a stricter threshold to avoid false positives
-        distance = face_recognition.face_distance([stored_face_encoding], captured_face_encoding)[0]
-        MATCH_THRESHOLD = 0.45  # stricter than default (~0.6)
+        # Compare against the closest template with a stricter threshold to avoid false positives
+        distance = min_template_distance(templates, captured_face_encoding)
         if distance <= MATCH_THRESHOLD:
             # Geolocation check (if coordinates provided)
             if student_latitude is not None and student_longitude is not None:
-                # Find the nearest teacher with a set location
-                cursor.execute("SELECT id, latitude, longitude FROM teachers WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
-                teachers = cursor.fetchall()
+                # Find the nearest teacher with a set location (the student's class teachers if enrolled)
+                teachers = geofence_teachers(student_id)
                 nearest_teacher_id = None
                 nearest_distance = None
                 for t in teachers or []:
@@ -363,7 +457,7 @@ def verify_face():
                 if nearest_teacher_id is not None and nearest_distance is not None:
                     if nearest_distance > 100:  # 100 meters radius
                         alert_message = f"Attendance not marked for {user.get('name')} (ID: {student_id}). Student is {nearest_distance:.2f} meters away from the teacher's location."
-                        socketio.emit('attendance_alert', {'type': 'geolocation', 'message': alert_message}, room=nearest_teacher_id)
+                        queue_alert(nearest_teacher_id, {'type': 'geolocation', 'message': alert_message})
                         return jsonify({'success': False, 'error': f'You are {nearest_distance:.2f} meters away from the designated attendance area. Attendance not marked.'})
 
             timestamp = datetime.datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
@@ -371,16 +465,24 @@ def verify_face():
             if is_offline:
                 return jsonify({'success': True, 'offline': True})
 
-            cursor.execute("SELECT student_id, first_name, last_name FROM students WHERE id = %s", (student_id,))
-            student_details = cursor.fetchone()
-            enrollment_no = student_details['student_id']
-            name = f"{student_details['first_name']} {student_details['last_name']}"
-
-            cursor.execute("""
-                INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-                VALUES (%s, %s, %s, 'Present', %s)
-            """, (student_id, enrollment_no, name, timestamp))
-            db.commit()
+            if user.get('enrollment_no'):
+                enrollment_no, name = user['enrollment_no'], user['full_name']
+            else:
+                enrollment_no, name = student_identity(student_id)
+
+            if ATTENDANCE_SPOOL:
+                # Acknowledged once fsync'd locally; the spool flusher writes it to
+                # the DB and notifies the dashboards
+                spool_attendance(student_id, enrollment_no, name, 'Present', timestamp)
+            else:
+                db = get_db_connection()
+                cursor = db.cursor(dictionary=True)
+                execute_write(db, "attendance.insert_present", (student_id, enrollment_no, name, timestamp))
+                refresh_monthly_rollup(cursor, [student_id], timestamp)
+                db.commit()
+                notify_attendance(cursor, [student_id])
+            # Learn this capture's lighting/pose later if it is a confident but new-looking match
+            queue_template_candidate(student_id, templates, captured_face_encoding, distance)
             return jsonify({'success': True, 'offline': False})
         else:
             return jsonify({'success': False, 'error': 'Face not recognized'})
@@ -405,7 +507,7 @@ def sync_attendance():
         
         synced_count = 0
         skipped_invalid = 0
-        MATCH_THRESHOLD = 0.45
+        synced_months = {}  # (year, month) -> set of student ids for the rollup refresh
 
         for record in records:
             try:
@@ -421,43 +523,33 @@ def sync_attendance():
 
                 timestamp = datetime.datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
 
-                # Avoid duplicate for the day
-                cursor.execute(
-                    """
-                    SELECT id FROM attendance
-                    WHERE student_id = %s AND DATE(marked_at) = %s
-                    """,
-                    (student_id, timestamp.date()),
-                )
-                if cursor.fetchone():
+                # Avoid duplicate for the day; if the verify-face copy of this
+                # capture is still spooled, the spool flush drops it instead
+                day = timestamp.date()
+                if fetch_one(db, "attendance.exists_between", (student_id, day, day + datetime.timedelta(days=1))):
                     continue
 
                 # Decode image from base64
                 try:
                     image_data = base64.b64decode(image_data_url.split(',')[1])
-                    nparr = np.frombuffer(image_data, np.uint8)
-                    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
                 except Exception:
                     skipped_invalid += 1
                     continue
 
-                # Compute captured encoding
-                rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                face_encodings = face_recognition.face_encodings(rgb_img)
-                if not face_encodings:
+                # Compute captured encoding; a photo already sent to verify-face is a cache hit
+                captured_face_encoding = encode_image_bytes(image_data)
+                if captured_face_encoding is None:
                     skipped_invalid += 1
                     continue
-                captured_face_encoding = face_encodings[0]
 
                 # Fetch stored encoding for this student
-                cursor.execute("SELECT face_encoding, first_name, last_name, student_id AS enrollment_no FROM students WHERE id = %s", (student_id,))
-                student_row = cursor.fetchone()
-                if not student_row or not student_row.get('face_encoding'):
+                student_row = fetch_one(db, "student.identity", (student_id,))
+                templates = student_templates(student_id, cursor) if student_row else None
+                if templates is None:
                     skipped_invalid += 1
                     continue
 
-                stored_face_encoding = pickle.loads(student_row['face_encoding'])
-                distance = face_recognition.face_distance([stored_face_encoding], captured_face_encoding)[0]
+                distance = min_template_distance(templates, captured_face_encoding)
                 if distance > MATCH_THRESHOLD:
                     # Not the registered face
                     skipped_invalid += 1
@@ -465,8 +557,7 @@ def sync_attendance():
 
                 # Optional geofence check using recorded coordinates, if available
                 if student_latitude is not None and student_longitude is not None:
-                    cursor.execute("SELECT id, latitude, longitude FROM teachers WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
-                    teachers = cursor.fetchall()
+                    teachers = get_geofence_teachers(cursor, student_id)
                     nearest_distance = None
                     for t in teachers or []:
                         try:
@@ -484,24 +575,20 @@ def sync_attendance():
                         continue
 
                 # Insert attendance
-                cursor.execute(
-                    """
-                    INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-                    VALUES (%s, %s, %s, 'Present', %s)
-                    """,
-                    (
-                        student_id,
-                        student_row['enrollment_no'],
-                        f"{student_row['first_name']} {student_row['last_name']}",
-                        timestamp,
-                    ),
-                )
+                enrollment_no, first_name, last_name = student_row
+                execute_write(db, "attendance.insert_present", (
+                    student_id, enrollment_no, f"{first_name} {last_name}", timestamp
+                ))
+                synced_months.setdefault((timestamp.year, timestamp.month), set()).add(student_id)
                 synced_count += 1
             except Exception:
                 skipped_invalid += 1
                 continue
 
+        for (year, month), student_ids in synced_months.items():
+            refresh_monthly_rollup(cursor, student_ids, datetime.date(year, month, 1))
         db.commit()
+        notify_attendance(cursor, set().union(*synced_months.values()))
         return jsonify({'success': True, 'synced_count': synced_count, 'skipped': skipped_invalid})
 
     except Exception as e:
@@ -520,14 +607,20 @@ def get_student_id():
 
 @app.route("/api/student-monthly-stats")
 @student_required
+@conditional_json(student_scopes)
 def student_monthly_stats():
     """Provides monthly attendance statistics for a student."""
     try:
         student_id = session['user']['id']
-        db = get_db_connection()
-        cursor = db.cursor(dictionary=True)
-
         today = datetime.date.today()
+        # Keyed by the ETag, not just the day: the versions are shared by all
+        # workers, so a write anywhere retires the entry in every process, and
+        # a payload is only stored under a version read before its queries ran
+        cache_key = (student_id, 'monthly', g.get('etag') or today)
+        cached = get_cached_student_stats(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
         first_day_of_month = today.replace(day=1)
         # Handle December edge case
         if today.month == 12:
@@ -537,15 +630,9 @@ def student_monthly_stats():
         
         total_days_in_month = (last_day_of_month - first_day_of_month).days + 1
 
-        cursor.execute("""
-            SELECT COUNT(DISTINCT DATE(marked_at)) as present_days
-            FROM attendance
-            WHERE student_id = %s
-            AND MONTH(marked_at) = %s
-            AND YEAR(marked_at) = %s
-            AND status = 'Present'
-        """, (student_id, today.month, today.year))
-        present_days = cursor.fetchone()['present_days']
+        db = get_db_connection()
+        cursor = db.cursor(dictionary=True)
+        present_days = get_month_present_days(cursor, student_id, today.year, today.month)
 
         absent_days = total_days_in_month - present_days
 
@@ -553,12 +640,14 @@ def student_monthly_stats():
         if total_days_in_month > 0:
             percentage = round((present_days / total_days_in_month) * 100)
 
-        return jsonify({
+        payload = {
             'success': True,
             'percentage': percentage,
             'present_days': present_days,
             'absent_days': absent_days
-        })
+        }
+        set_cached_student_stats(cache_key, payload)
+        return jsonify(payload)
 
     except Exception as e:
         print(f"Error getting student monthly stats: {e}")
@@ -567,24 +656,44 @@ def student_monthly_stats():
         if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
+@app.route("/api/student-attendance-history")
+@student_required
+def student_attendance_history():
+    """Provides per-month attendance for the last N months (default 6, max 24) from the rollup."""
+    try:
+        student_id = session['user']['id']
+        months = min(max(request.args.get('months', 6, type=int), 1), 24)
+        cache_key = (student_id, 'history', months, datetime.date.today())
+        cached = get_cached_student_stats(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        db = get_db_connection()
+        cursor = db.cursor(dictionary=True)
+        payload = {'success': True, 'months': get_monthly_history(cursor, student_id, months)}
+        set_cached_student_stats(cache_key, payload)
+        return jsonify(payload)
+
+    except Exception as e:
+        print(f"Error getting student attendance history: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if 'cursor' in locals(): cursor.close()
+        if 'db' in locals(): db.close()
+
 @app.route('/api/summary')
 @teacher_required
+@conditional_json(teacher_scopes)
 def get_summary():
     """Provides a summary of today's attendance for the teacher dashboard."""
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT COUNT(*) as total FROM students")
-        total_students_result = cursor.fetchone()
-        total_students = int(total_students_result['total']) if total_students_result else 0
-        
-        cursor.execute("""
-            SELECT COUNT(DISTINCT student_id) as present
-            FROM attendance
-            WHERE DATE(marked_at) = CURDATE() AND status = 'Present'
-        """)
-        present_count_result = cursor.fetchone()
-        present_count = int(present_count_result['present']) if present_count_result else 0
+        roster_sql, roster_params = request_roster_filter(cursor)
+        attendance_roster_sql, _ = request_roster_filter(cursor, column="a.student_id")
+
+        total_students = int(fetch_value(db, "roster.total", roster_params, roster=roster_sql) or 0)
+        present_count = int(fetch_value(db, "roster.present_today", roster_params, roster=attendance_roster_sql) or 0)
         
         absent_count = total_students - present_count
         attendance_rate = round((present_count / total_students * 100) if total_students > 0 else 0)
@@ -597,50 +706,134 @@ def get_summary():
         })
     except Exception as e:
         print(f"Error getting summary: {e}")
-        return jsonify({
+        response = jsonify({
             'total': 0,
             'present': 0,
             'absent': 0,
             'rate': 0
         })
+        response.cache_control.no_store = True
+        return response
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
+STUDENT_LIST_PAGE_SIZE = 50
+STUDENT_LIST_MAX_PAGE_SIZE = 200
+STUDENT_LIST_FIELDS = ('name', 'enrollment_no', 'check_in_time')
+
+def encode_list_cursor(values):
+    """Encodes keyset pagination values into an opaque URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_list_cursor(token):
+    """Decodes a token from encode_list_cursor(); returns None if it is malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+    except Exception:
+        return None
+
+def parse_student_list_cursor(token, status):
+    """
+    Decodes a student list cursor and checks its shape for `status`:
+    [marked_at, id] for Present (marked_at returned as a datetime), [id]
+    otherwise. Returns None if the token is malformed or for the other list.
+    """
+    values = decode_list_cursor(token)
+    if not isinstance(values, list) or not all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in values):
+        return None
+    if status == 'Present':
+        if len(values) != 2 or not isinstance(values[0], str) or not isinstance(values[1], int):
+            return None
+        try:
+            return [datetime.datetime.fromisoformat(values[0]), values[1]]
+        except ValueError:
+            return None
+    if len(values) != 1 or not isinstance(values[0], int):
+        return None
+    return values
+
 @app.route('/api/get-present-students')
 @teacher_required
+@conditional_json(teacher_scopes)
 def get_present_students():
-    """Returns a list of students based on their attendance status for today."""
+    """
+    Returns one page of students based on their attendance status for today.
+    Query args: status (Present/Absent), limit, cursor (from next_cursor),
+    q (prefix search on name or enrollment no), fields (comma separated subset
+    of name, enrollment_no, check_in_time). The total is only computed for the
+    first page of an unfiltered list.
+    """
     status = request.args.get('status', 'Present')
+    limit = min(max(request.args.get('limit', STUDENT_LIST_PAGE_SIZE, type=int), 1), STUDENT_LIST_MAX_PAGE_SIZE)
+    search = (request.args.get('q') or '').strip()
+    fields = [f for f in (request.args.get('fields') or '').split(',') if f in STUDENT_LIST_FIELDS] or list(STUDENT_LIST_FIELDS)
+    cursor_token = request.args.get('cursor')
+    after = parse_student_list_cursor(cursor_token, status) if cursor_token else None
+    if cursor_token and after is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    search_sql = ""
+    search_params = []
+    if search:
+        like = search.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+        search_sql = "AND (s.first_name LIKE %s ESCAPE '!' OR s.last_name LIKE %s ESCAPE '!' OR s.student_id LIKE %s ESCAPE '!')"
+        search_params = [like, like, like]
+
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
     
     try:
+        roster_sql, roster_params = request_roster_filter(cursor)
+        search_sql = roster_sql + "\n" + search_sql
+        search_params = list(roster_params) + search_params
         if status == 'Present':
-            cursor.execute("""
-                SELECT s.first_name, s.last_name, s.student_id AS enrollment_no, MAX(a.marked_at) as marked_at
-                FROM students s
-                JOIN attendance a ON s.id = a.student_id
-                WHERE DATE(a.marked_at) = CURDATE() AND a.status = 'Present'
-                GROUP BY s.id, s.first_name, s.last_name, s.student_id
-                ORDER BY marked_at DESC
-            """)
+            having_sql = ""
+            having_params = []
+            if after:
+                having_sql = "HAVING MAX(a.marked_at) < %s OR (MAX(a.marked_at) = %s AND s.id < %s)"
+                having_params = [after[0], after[0], after[1]]
+            rows = fetch_all(
+                db, "roster.present_page", search_params + having_params + [limit + 1],
+                dict_rows=True, filters=search_sql, having=having_sql
+            )
         else:
-            cursor.execute("""
-                SELECT s.first_name, s.last_name, s.student_id AS enrollment_no, NULL as marked_at
-                FROM students s
-                LEFT JOIN attendance a ON s.id = a.student_id AND DATE(a.marked_at) = CURDATE() AND a.status = 'Present'
-                WHERE a.id IS NULL
-            """)
-        
+            after_sql = ""
+            after_params = []
+            if after:
+                after_sql = "AND s.id > %s"
+                after_params = [after[0]]
+            rows = fetch_all(
+                db, "roster.absent_page", search_params + after_params + [limit + 1],
+                dict_rows=True, filters=search_sql, after=after_sql
+            )
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            if status == 'Present':
+                next_cursor = encode_list_cursor([last['marked_at'].isoformat(), last['id']])
+            else:
+                next_cursor = encode_list_cursor([last['id']])
+
         students = []
-        for row in cursor.fetchall():
-            students.append({
+        for row in rows:
+            student = {
                 'name': f"{row['first_name']} {row['last_name']}".strip(),
                 'enrollment_no': row['enrollment_no'],
                 'check_in_time': row['marked_at'].strftime('%I:%M %p') if row and row.get('marked_at') else ''
-            })
-        return jsonify(students)
+            }
+            students.append({f: student[f] for f in fields})
+
+        total = None
+        if not after and not search:
+            attendance_roster_sql, _ = request_roster_filter(cursor, column="a.student_id")
+            total = int(fetch_value(db, "roster.present_today", roster_params, roster=attendance_roster_sql))
+            if status != 'Present':
+                total = int(fetch_value(db, "roster.total", roster_params, roster=roster_sql)) - total
+
+        return jsonify({'students': students, 'next_cursor': next_cursor, 'total': total})
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
@@ -651,168 +844,270 @@ def mark_attendance():
     """Manually marks a student as present."""
     enrollment_no = request.json.get('enrollment_no')
 
-    db = get_db_connection()
-    cursor = db.cursor(buffered=True, dictionary=True)
-
     try:
-        cursor.execute("SELECT id, first_name, last_name FROM students WHERE student_id = %s", (enrollment_no,))
-        student = cursor.fetchone()
+        if ATTENDANCE_SPOOL:
+            # Spooled without a DB connection; the flusher writes and notifies
+            student = student_by_enrollment_no(enrollment_no)
+            if not student:
+                return jsonify({'error': 'Student not found'}), 404
+            name = f"{student['first_name']} {student['last_name']}"
+            spool_attendance(student['id'], enrollment_no, name, 'Present', datetime.datetime.now())
+            return jsonify({'success': True})
+
+        db = get_db_connection()
+        cursor = db.cursor(buffered=True, dictionary=True)
+        student = fetch_one(db, "student.by_enrollment_no", (enrollment_no,), dict_rows=True)
 
         if not student:
             return jsonify({'error': 'Student not found'}), 404
 
-        cursor.execute("""
-            INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-            VALUES (%s, %s, %s, 'Present', NOW())
-        """, (
-            student['id'],
-            enrollment_no,
-            f"{student['first_name']} {student['last_name']}"
-        ))
+        name = f"{student['first_name']} {student['last_name']}"
+        execute_write(db, "attendance.insert_present", (student['id'], enrollment_no, name, datetime.datetime.now()))
+        refresh_monthly_rollup(cursor, [student['id']])
         db.commit()
+        notify_attendance(cursor, [student['id']])
         return jsonify({'success': True})
     except Exception as e:
-        db.rollback()
+        if 'db' in locals(): db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
-@app.route('/api/mark-all-present', methods=['POST'])
+def run_bulk_marking(status, student_ids=None, class_id=None, class_name=None):
+    """Runs bulk_mark_status on the teacher's roster and queues one attendance delta for the teacher's room."""
+    db = get_db_connection()
+    try:
+        cursor = db.cursor(buffered=True)
+        try:
+            roster = teacher_roster_filter(cursor, session['user']['id'], class_id=class_id, class_name=class_name)
+        finally:
+            cursor.close()
+        affected = bulk_mark_status(db, status, student_ids, roster=roster)
+    finally:
+        db.close()
+    if affected:
+        bump_school()
+    queue_attendance_delta([session['user']['id']], status, affected)
+    return affected
+
+@app.route('/api/bulk-attendance', methods=['POST'])
 @teacher_required
-def mark_all_present():
-    """Forces everyone to Present for today: removes today's records and inserts Present for all students."""
+def bulk_attendance():
+    """
+    Sets today's status (Present/Absent) for the teacher's roster, optionally
+    narrowed to class_id (one section), class_name (all sections) and/or a
+    student_ids list. Only changed rows are written.
+    """
+    data = request.get_json() or {}
+    status = data.get('status')
+    student_ids = data.get('student_ids')
+    class_id = data.get('class_id')
+    class_name = data.get('class_name')
+
+    if status not in BULK_STATUSES:
+        return jsonify({'error': 'Status must be Present or Absent'}), 400
+    if student_ids is not None and not isinstance(student_ids, list):
+        return jsonify({'error': 'student_ids must be a list'}), 400
+
+    try:
+        affected = run_bulk_marking(status, student_ids, class_id, class_name)
+        return jsonify({'success': True, 'affected': affected})
+    except Exception as e:
+        print(f"Error in bulk attendance: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def roster_student_ids(class_id=None, class_name=None):
+    """students.id on the logged-in teacher's roster, or None when that is the whole school."""
     db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
-    
     try:
-        # Remove today's attendance records (Present/Absent) to reset state
-        cursor.execute("DELETE FROM attendance WHERE DATE(marked_at) = CURDATE()")
-        # Insert Present for all students
-        cursor.execute(
-            """
-            INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-            SELECT
-                s.id,
-                s.student_id,
-                CONCAT(s.first_name, ' ', s.last_name) AS name,
-                'Present',
-                NOW()
-            FROM students s
-            """
-        )
-        db.commit()
-        return jsonify({'success': True})
+        cursor = db.cursor(buffered=True)
+        try:
+            roster_sql, roster_params = teacher_roster_filter(
+                cursor, session['user']['id'], class_id=class_id, class_name=class_name
+            )
+            if not roster_sql:
+                return None
+            return [row[0] for row in fetch_all(db, "roster.student_ids", roster_params, roster=roster_sql)]
+        finally:
+            cursor.close()
+    finally:
+        db.close()
+
+@app.route('/api/classroom-attendance', methods=['POST'])
+@teacher_required
+def classroom_attendance():
+    """
+    Marks everyone recognised in one or a few classroom photos (multipart
+    field 'photos') present, within the teacher's roster or the optional
+    class_id/class_name form fields. Returns the matched students and crops
+    of faces that matched nobody.
+    """
+    photos = request.files.getlist('photos')
+    if not photos:
+        return jsonify({'error': 'No photos uploaded'}), 400
+    if len(photos) > MAX_CLASSROOM_PHOTOS:
+        return jsonify({'error': f'At most {MAX_CLASSROOM_PHOTOS} photos per request'}), 400
+    class_id = request.form.get('class_id', type=int)
+    class_name = request.form.get('class_name') or None
+
+    images = []
+    for photo in photos:
+        img = decode_photo(photo.read())
+        if img is None:
+            return jsonify({'error': f'Could not read {photo.filename}'}), 400
+        images.append(img)
+
+    try:
+        # Recognition is slow, so no connection is held while it runs
+        roster_ids = roster_student_ids(class_id, class_name)
+        templates, template_ids = roster_templates(get_gallery(), roster_ids)
+        matched, unmatched = recognize_photos(images, templates, template_ids)
+
+        affected = 0
+        if matched:
+            student_ids = [m['student_id'] for m in matched]
+            db = get_db_connection()
+            placeholders = ", ".join(["%s"] * len(student_ids))
+            students = {
+                row[0]: row[1:] for row in fetch_all(db, "students.identities", student_ids, ids=placeholders)
+            }
+            for m in matched:
+                enrollment_no, first_name, last_name = students.get(m['student_id'], (None, '', ''))
+                m['enrollment_no'] = enrollment_no
+                m['name'] = f"{first_name} {last_name}".strip()
+            affected = run_bulk_marking('Present', student_ids, class_id, class_name)
+
+        return jsonify({
+            'success': True,
+            'faces_detected': len(matched) + len(unmatched),
+            'marked': affected,
+            'matched': matched,
+            'unmatched': unmatched
+        })
     except Exception as e:
-        db.rollback()
-        print(f"Error marking all present: {e}")
+        print(f"Error in classroom attendance: {e}")
         return jsonify({'error': str(e)}), 500
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
+@app.route('/api/mark-all-present', methods=['POST'])
+@teacher_required
+def mark_all_present():
+    """Forces everyone to Present for today, touching only students that are not already present."""
+    try:
+        affected = run_bulk_marking('Present', class_id=request.args.get('class_id', type=int))
+        return jsonify({'success': True, 'affected': affected})
+    except Exception as e:
+        print(f"Error marking all present: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/mark-all-absent', methods=['POST'])
 @teacher_required
 def mark_all_absent():
-    """Forces everyone to Absent for today: removes today's records and inserts Absent for all students."""
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
+    """Forces everyone to Absent for today, touching only students that are not already absent."""
     try:
-        # Remove today's attendance records (Present/Absent) to reset state
-        cursor.execute("DELETE FROM attendance WHERE DATE(marked_at) = CURDATE()")
-        # Insert Absent for all students
-        cursor.execute(
-            """
-            INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-            SELECT
-                s.id,
-                s.student_id,
-                CONCAT(s.first_name, ' ', s.last_name) AS name,
-                'Absent',
-                NOW()
-            FROM students s
-            """
-        )
-        db.commit()
-        return jsonify({'success': True})
+        affected = run_bulk_marking('Absent', class_id=request.args.get('class_id', type=int))
+        return jsonify({'success': True, 'affected': affected})
     except Exception as e:
-        db.rollback()
         print(f"Error marking all absent: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'db' in locals(): db.close()
 
 @app.route('/api/manual-attendance-requests')
 @teacher_required
+@conditional_json(teacher_scopes)
 def get_manual_attendance_requests():
     """Retrieves all pending manual attendance requests."""
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT r.id, s.id as student_id, s.first_name, s.last_name, s.student_id AS enrollment_no
-            FROM manual_attendance_requests r
-            JOIN students s ON r.student_id = s.id
-            ORDER BY r.requested_at DESC
-        """)
-        requests = cursor.fetchall()
+        roster_sql, roster_params = request_roster_filter(cursor)
+        requests = fetch_all(db, "manual_requests.pending", roster_params, dict_rows=True, roster=roster_sql)
         return jsonify(requests)
     finally:
         if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
+def run_manual_resolution(request_ids, action):
+    """Resolves requests on the logged-in teacher's roster; returns (resolved ids, marked count)."""
+    db = get_db_connection()
+    try:
+        cursor = db.cursor(buffered=True)
+        try:
+            roster = request_roster_filter(cursor, column="r.student_id")
+        finally:
+            cursor.close()
+        resolved, student_ids, marked = resolve_manual_requests(db, request_ids, action, roster=roster)
+        if resolved:
+            cursor = db.cursor()
+            try:
+                if marked:
+                    notify_attendance(cursor, student_ids)
+                else:
+                    bump_for_students(cursor, student_ids)
+            finally:
+                cursor.close()
+        return resolved, marked
+    finally:
+        db.close()
+
 @app.route('/api/handle-manual-attendance-request', methods=['POST'])
 @teacher_required
 def handle_manual_attendance_request():
     """Approves or ignores a manual attendance request."""
     request_id = request.json.get('request_id')
     action = request.json.get('action')
-
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
+    if action not in MANUAL_REQUEST_ACTIONS or request_id is None:
+        return jsonify({'error': 'request_id and an action (approve/ignore) are required'}), 400
 
     try:
-        if action == 'approve':
-            cursor.execute("SELECT student_id FROM manual_attendance_requests WHERE id = %s", (request_id,))
-            result = cursor.fetchone()
-            if not result:
-                return jsonify({'error': 'Request not found'}), 404
-            student_id = result['student_id']
-
-            cursor.execute("SELECT id, first_name, last_name, student_id FROM students WHERE id = %s", (student_id,))
-            student = cursor.fetchone()
-
-            cursor.execute("""
-                INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
-                VALUES (%s, %s, %s, 'Present', NOW())
-            """, (
-                student['id'],
-                student['student_id'],
-                f"{student['first_name']} {student['last_name']}"
-            ))
-
-        cursor.execute("DELETE FROM manual_attendance_requests WHERE id = %s", (request_id,))
-        db.commit()
+        resolved, _ = run_manual_resolution([request_id], action)
+        if not resolved:
+            return jsonify({'error': 'Request not found'}), 404
         return jsonify({'success': True})
     except Exception as e:
-        db.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'db' in locals(): db.close()
+
+@app.route('/api/manual-attendance-requests/bulk', methods=['POST'])
+@teacher_required
+def bulk_handle_manual_attendance_requests():
+    """
+    Approves or ignores many manual attendance requests (request_ids list) in
+    one transaction. Ids that are already resolved or outside the teacher's
+    roster are skipped and left out of `resolved`.
+    """
+    data = request.get_json() or {}
+    request_ids = data.get('request_ids')
+    action = data.get('action')
+    if action not in MANUAL_REQUEST_ACTIONS:
+        return jsonify({'error': 'Action must be approve or ignore'}), 400
+    if not isinstance(request_ids, list) or not request_ids:
+        return jsonify({'error': 'request_ids must be a non-empty list'}), 400
+    if len(request_ids) > MAX_RESOLVE_BATCH:
+        return jsonify({'error': f'At most {MAX_RESOLVE_BATCH} requests per call'}), 400
+
+    try:
+        resolved, marked = run_manual_resolution(request_ids, action)
+        return jsonify({'success': True, 'resolved': resolved, 'marked': marked})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error resolving manual attendance requests: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/request-manual-attendance', methods=['POST'])
 @student_required
 def request_manual_attendance():
-    """Allows a student to request manual attendance marking."""
+    """Allows a student to request manual attendance marking (once per day while pending)."""
     student_id = session['user']['id']
     db = get_db_connection()
     cursor = db.cursor()
     try:
-        cursor.execute("INSERT INTO manual_attendance_requests (student_id) VALUES (%s)", (student_id,))
+        created = create_manual_request(cursor, student_id)
         db.commit()
-        return jsonify({'success': True})
+        if created:
+            bump_for_students(cursor, [student_id])
+        return jsonify({'success': True, 'already_pending': not created})
     except Exception as e:
         db.rollback()
         return jsonify({'error': str(e)}), 500
@@ -850,44 +1145,97 @@ def set_teacher_location():
             return jsonify({'error': 'Latitude and longitude are required'}), 400
 
         db = get_db_connection()
-        cursor = db.cursor()
-        cursor.execute(
-            "UPDATE teachers SET latitude = %s, longitude = %s WHERE id = %s",
-            (latitude, longitude, teacher_id)
-        )
+        execute_write(db, "teacher.set_location", (latitude, longitude, teacher_id))
         db.commit()
+        forget_cached('geofence')
         return jsonify({'success': True, 'message': 'Teacher location updated successfully'})
     except Exception as e:
         print(f"Error setting teacher location: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
+@app.route('/api/classes', methods=['GET', 'POST'])
+@teacher_required
+def teacher_classes():
+    """Lists the teacher's classes with roster sizes (GET) or creates a class/section (POST)."""
+    teacher_id = session['user']['id']
+    db = get_db_connection()
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            name = (data.get('name') or '').strip()
+            section = (data.get('section') or '').strip()
+            if not name:
+                return jsonify({'error': 'Class name is required'}), 400
+            _, class_id = execute_write(db, "classes.insert", (teacher_id, name, section))
+            db.commit()
+            bump(f"teacher-{teacher_id}")
+            return jsonify({'success': True, 'id': class_id})
+
+        return jsonify(fetch_all(db, "classes.for_teacher", (teacher_id,), dict_rows=True))
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if 'db' in locals(): db.close()
+
+@app.route('/api/classes/<int:class_id>/enrollments', methods=['POST', 'DELETE'])
+@teacher_required
+def class_enrollments(class_id):
+    """Adds (POST) or removes (DELETE) students, given by enrollment number, from one of the teacher's classes."""
+    enrollment_nos = (request.get_json() or {}).get('enrollment_nos') or []
+    if not isinstance(enrollment_nos, list) or not enrollment_nos:
+        return jsonify({'error': 'enrollment_nos must be a non-empty list'}), 400
+
+    db = get_db_connection()
+    try:
+        if not fetch_one(db, "classes.owned", (class_id, session['user']['id'])):
+            return jsonify({'error': 'Class not found'}), 404
+
+        placeholders = ", ".join(["%s"] * len(enrollment_nos))
+        name = "class_enrollments.add" if request.method == 'POST' else "class_enrollments.remove"
+        affected, _ = execute_write(db, name, (class_id, *enrollment_nos), enrollment_nos=placeholders)
+        db.commit()
+        bump(f"teacher-{session['user']['id']}")
+        return jsonify({'success': True, 'affected': affected})
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if 'db' in locals(): db.close()
+
+@app.route('/api/spool-status')
+@teacher_required
+def spool_status():
+    """Write-behind spool lag for the worker serving the request."""
+    return jsonify(spool_stats())
+
+@app.route('/api/embedding-cache-status')
+@teacher_required
+def embedding_cache_status():
+    """Hit rate and size of the face-encoding cache in the worker serving the request."""
+    return jsonify(embedding_cache_stats())
+
+@app.route('/api/query-stats')
+@teacher_required
+def query_stats_status():
+    """Per-statement DB call counts and latency histograms for the worker serving the request."""
+    return jsonify(query_stats())
+
 @app.route('/api/student-details/<int:student_id>')
 @teacher_required
 def get_student_details(student_id):
     """Retrieves details for a specific student."""
     db = get_db_connection()
-    # Use buffered cursor to avoid 'Unread result found' when not consuming all rows
-    cursor = db.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("""
-            SELECT s.first_name, s.last_name, s.student_id AS enrollment_no, a.status
-            FROM students s
-            LEFT JOIN attendance a ON s.id = a.student_id AND DATE(a.marked_at) = CURDATE()
-            WHERE s.id = %s
-            ORDER BY a.marked_at DESC
-            LIMIT 1
-        """, (student_id,))
-        student = cursor.fetchone()
+        student = fetch_one(db, "student.details_today", (student_id,), dict_rows=True)
         
         if not student:
             return jsonify({'error': 'Student not found'}), 404
 
         return jsonify(student)
     finally:
-        if 'cursor' in locals(): cursor.close()
         if 'db' in locals(): db.close()
 
 
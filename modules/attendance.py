@@ -1,33 +1,92 @@
-from database import get_db_connection
+from modules.database import get_db_connection
+from modules.rollup import refresh_monthly_rollup
+from modules.gallery import get_gallery
+from modules.detectors import detect_faces
+from modules.classroom import distance_matrix
+from modules.spool import ATTENDANCE_SPOOL, spool_attendance, spool_flush_loop, get_spool
+from modules.versions import bump_for_students
+from modules.queries import cursor_execute, cursor_fetch_all, placeholders
+import threading
+import datetime
 import cv2
 import face_recognition
 import numpy as np
-import pickle
 
-def load_known_faces():
-    """Load all registered faces from DB"""
+MATCH_TOLERANCE = 0.5
+
+def load_student_details(student_ids):
+    """Maps DB id -> (permanent student_id, full name) for the given students"""
+    student_ids = [int(i) for i in student_ids]
+    if not student_ids:
+        return {}
     db = get_db_connection()
     cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT id, student_id, first_name, last_name, face_encoding FROM students WHERE face_encoding IS NOT NULL")
-    students = cursor.fetchall()
+    students = cursor_fetch_all(cursor, "students.identities", student_ids, ids=placeholders(student_ids))
     cursor.close()
     db.close()
-
-    known_encodings = []
-    known_ids = []
-    
-    for s in students:
-        encoding = pickle.loads(s["face_encoding"])  # deserialize
-        known_encodings.append(encoding)
-        # include both DB id and permanent student_id
-        known_ids.append((s["id"], s["student_id"], f"{s['first_name']} {s['last_name']}"))
-
-    return known_encodings, known_ids
+    return {s["id"]: (s["student_id"], f"{s['first_name']} {s['last_name']}") for s in students}
+
+
+def match_frame(frame, gallery=None):
+    """
+    Detects and identifies the faces in one BGR frame.
+    Returns [(db_id or None, distance, (top, right, bottom, left))].
+    """
+    gallery = gallery if gallery is not None else get_gallery()
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    face_locations = detect_faces(rgb_frame, "camera")
+    if not face_locations:
+        return []
+    encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+    if len(gallery) == 0:
+        return [(None, None, location) for location in face_locations]
+
+    # All faces against the whole gallery in one matrix product
+    distances = distance_matrix(encodings, gallery.encodings)
+    best = np.argmin(distances, axis=1)
+    results = []
+    for i, location in enumerate(face_locations):
+        distance = float(distances[i, best[i]])
+        db_id = int(gallery.ids[best[i]]) if distance <= MATCH_TOLERANCE else None
+        results.append((db_id, distance, location))
+    return results
+
+
+def record_presence(db_id, enrollment_no, name):
+    """Writes one Present row for now (through the spool when ATTENDANCE_SPOOL is on)."""
+    if ATTENDANCE_SPOOL:
+        spool_attendance(db_id, enrollment_no, name, "Present", datetime.datetime.now())
+        return
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        cursor_execute(cursor, "attendance.insert", (db_id, enrollment_no, name, "Present"))
+        refresh_monthly_rollup(cursor, [db_id])
+        db.commit()
+        bump_for_students(cursor, [db_id])
+    finally:
+        cursor.close()
+        db.close()
+
+
+def flush_spool_on_exit():
+    """Best effort; anything left is replayed by the next process to start."""
+    if not ATTENDANCE_SPOOL:
+        return
+    try:
+        while get_spool().flush():
+            pass
+    except Exception as e:
+        print(f"Attendance spool flush error: {e}")
 
 
 def mark_attendance_from_camera():
-    known_encodings, known_ids = load_known_faces()
     marked_students = set()  # ✅ to store already marked (DB id)
+    details = {}  # DB id -> (student_id, name), filled on first match
+
+    if ATTENDANCE_SPOOL:
+        # Check-ins keep working while the DB is slow; the flusher catches up
+        threading.Thread(target=spool_flush_loop, daemon=True).start()
 
     cap = cv2.VideoCapture(0)  # Webcam
     while True:
@@ -35,32 +94,17 @@ def mark_attendance_from_camera():
         if not ret:
             break
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Detect faces
-        face_locations = face_recognition.face_locations(rgb_frame)
-        encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        for encoding, (top, right, bottom, left) in zip(encodings, face_locations):
-            matches = face_recognition.compare_faces(known_encodings, encoding, tolerance=0.5)
-            face_distances = face_recognition.face_distance(known_encodings, encoding)
-
-            best_match_index = np.argmin(face_distances)
-
-            if matches[best_match_index]:
-                db_id, enrollment_no, name = known_ids[best_match_index]
+        # get_gallery() is re-read each frame so registrations from the web app show up without a restart
+        for db_id, distance, (top, right, bottom, left) in match_frame(frame):
+            if db_id is not None:
+                if db_id not in details:
+                    details.update(load_student_details([db_id]))
+                if db_id not in details:
+                    continue
+                enrollment_no, name = details[db_id]
 
                 if db_id not in marked_students:  # ✅ mark only once
-                    db = get_db_connection()
-                    cursor = db.cursor()
-                    cursor.execute(
-                        "INSERT INTO attendance (student_id, enrollment_no, name, status) VALUES (%s, %s, %s, %s)",
-                        (db_id, enrollment_no, name, "Present")
-                    )
-                    db.commit()
-                    cursor.close()
-                    db.close()
-
+                    record_presence(db_id, enrollment_no, name)
                     marked_students.add(db_id)  # ✅ remember marked student
 
                 # Draw rectangle & name
@@ -75,6 +119,7 @@ def mark_attendance_from_camera():
 
     cap.release()
     cv2.destroyAllWindows()
+    flush_spool_on_exit()
 
 if __name__ == "__main__":
     mark_attendance_from_camera()
\ No newline at end of file
@@ -0,0 +1,78 @@
+from modules.rollup import refresh_monthly_rollup
+from modules.queries import cursor_execute, cursor_fetch_all, placeholders
+
+BULK_CHUNK_SIZE = 500
+BULK_STATUSES = ('Present', 'Absent')
+
+
+def _iter_student_chunks(cursor, student_ids, roster, chunk_size):
+    """
+    Yields lists of students.id, either from the given list or by walking the
+    students table by id, restricted to the roster filter from modules.classes.
+    """
+    roster_sql, roster_params = roster
+    if student_ids is not None:
+        ids = sorted({int(sid) for sid in student_ids})
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            if roster_sql:
+                rows = cursor_fetch_all(
+                    cursor, "bulk.roster_chunk", (*chunk, *roster_params), ids=placeholders(chunk), roster=roster_sql
+                )
+                chunk = [row[0] for row in rows]
+            if chunk:
+                yield chunk
+        return
+
+    last_id = 0
+    while True:
+        rows = cursor_fetch_all(cursor, "bulk.roster_page", (last_id, *roster_params, chunk_size), roster=roster_sql)
+        ids = [row[0] for row in rows]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def bulk_mark_status(db, status, student_ids=None, roster=("", ()), chunk_size=BULK_CHUNK_SIZE):
+    """
+    Sets today's attendance status for a set of students.
+    Only students whose status actually changes are touched: existing rows with
+    a different status are updated and students with no row today get one
+    inserted. Each chunk of students is its own short transaction so locks are
+    never held across the whole table.
+    student_ids: list of students.id to scope the operation, or None for everyone.
+    roster: (sql, params) from modules.classes.teacher_roster_filter to limit
+    the operation to a teacher's class or section.
+    Returns the number of students whose status changed.
+    """
+    if status not in BULK_STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+
+    read_cursor = db.cursor(buffered=True)
+    cursor = db.cursor()
+    affected = 0
+    try:
+        for chunk in _iter_student_chunks(read_cursor, student_ids, roster, chunk_size):
+            in_chunk = placeholders(chunk)
+            try:
+                # A student counts as present if any of today's rows is Present,
+                # matching the dashboard queries; only flip those that differ.
+                rows = cursor_fetch_all(cursor, "bulk.changed_today", (*chunk, status == 'Present'), ids=in_chunk)
+                changed = [row[0] for row in rows]
+                if changed:
+                    cursor_execute(cursor, "bulk.set_status", (status, *changed, status), ids=placeholders(changed))
+
+                inserted = cursor_execute(cursor, "bulk.insert_missing", (status, *chunk), ids=in_chunk)
+
+                if changed or inserted:
+                    refresh_monthly_rollup(cursor, chunk)
+                db.commit()
+                affected += len(changed) + max(inserted, 0)
+            except Exception:
+                db.rollback()
+                raise
+    finally:
+        cursor.close()
+        read_cursor.close()
+    return affected
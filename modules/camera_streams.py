@@ -0,0 +1,230 @@
+"""
+Headless multi-camera attendance.
+
+    python -m modules.camera_streams --source 0 --source rtsp://cam-7b/stream --fps 2
+    python -m modules.camera_streams --source "classroom.mp4|5" --workers 2
+
+Each --source is a device index, an RTSP/HTTP URL or a video file (played at
+its own frame rate, for local testing), optionally followed by "|<fps>" to
+override --fps for that stream. Sources can also come from CAMERA_SOURCES
+(comma separated).
+
+One reader thread per stream keeps only the newest frame. A single scheduler
+hands frames to a shared pool of recognition processes: each stream gets at
+most --fps frames per second and at most one frame in flight, and when
+several are due the one that has waited longest goes first, so a busy or
+high-resolution camera cannot starve the others. Workers map the shared
+gallery (modules/gallery.py), so every process reads the same pages. Matches
+come back to this process, which marks each student once per day across all
+streams on a separate writer thread.
+"""
+import os
+import sys
+import time
+import queue
+import argparse
+import datetime
+import threading
+import multiprocessing
+import concurrent.futures
+import cv2
+from modules.attendance import match_frame, record_presence, load_student_details, flush_spool_on_exit
+from modules.spool import ATTENDANCE_SPOOL, spool_flush_loop
+
+DEFAULT_FPS = 2.0
+RECONNECT_DELAY = 5  # seconds before reopening a dropped live stream
+STATS_INTERVAL = 60  # seconds between per-stream stats lines
+
+
+class CameraStream:
+    """One source: a reader thread that keeps the newest frame, plus scheduling state."""
+
+    def __init__(self, source, fps=DEFAULT_FPS):
+        self.name = source
+        self.source = int(source) if source.isdigit() else source
+        self.is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.interval = 1.0 / fps
+        self.next_due = 0.0
+        self.in_flight = None
+        self.finished = False
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_seq = 0
+        self._taken_seq = 0
+
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.frames_processed = 0
+        self.faces_recognized = 0
+
+    def has_new_frame(self):
+        with self._lock:
+            return self._frame_seq > self._taken_seq
+
+    def take_frame(self):
+        with self._lock:
+            self._taken_seq = self._frame_seq
+            return self._frame
+
+    def _put_frame(self, frame):
+        with self._lock:
+            if self._frame_seq > self._taken_seq:
+                self.frames_skipped += 1
+            self._frame = frame
+            self._frame_seq += 1
+        self.frames_read += 1
+
+    def read_loop(self, stop):
+        while not stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                print(f"[{self.name}] could not open source")
+                if self.is_file:
+                    break
+                stop.wait(RECONNECT_DELAY)
+                continue
+
+            # Files are played in real time; live sources pace themselves
+            file_fps = cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+            pace = 1.0 / file_fps if file_fps and file_fps > 0 else 0
+            while not stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                self._put_frame(frame)
+                if pace:
+                    stop.wait(pace)
+            cap.release()
+
+            if self.is_file:
+                break
+            if not stop.is_set():
+                print(f"[{self.name}] stream dropped, reconnecting in {RECONNECT_DELAY}s")
+                stop.wait(RECONNECT_DELAY)
+        self.finished = True
+
+    def stats_line(self):
+        return (f"[{self.name}] read {self.frames_read} processed {self.frames_processed} "
+                f"skipped {self.frames_skipped} recognized {self.faces_recognized}")
+
+
+def parse_source(spec, default_fps):
+    """Splits "rtsp://...|3" into ("rtsp://...", 3.0); no suffix means default_fps."""
+    source, sep, fps = spec.rpartition("|")
+    if sep and fps.replace(".", "", 1).isdigit():
+        return source, float(fps)
+    return spec, default_fps
+
+
+class AttendanceWriter:
+    """Marks each recognised student once per day, off the scheduler thread."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.marked = set()
+        self.marked_day = datetime.date.today()
+        self.details = {}  # DB id -> (student_id, name)
+
+    def run(self, stop):
+        while not (stop.is_set() and self.queue.empty()):
+            try:
+                stream_name, db_id = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            today = datetime.date.today()
+            if today != self.marked_day:
+                self.marked, self.marked_day = set(), today
+            if db_id in self.marked:
+                continue
+            try:
+                if db_id not in self.details:
+                    self.details.update(load_student_details([db_id]))
+                if db_id not in self.details:
+                    continue
+                enrollment_no, name = self.details[db_id]
+                record_presence(db_id, enrollment_no, name)
+                self.marked.add(db_id)
+                print(f"[{stream_name}] marked {name} ({enrollment_no}) present")
+            except Exception as e:
+                print(f"[{stream_name}] error marking attendance: {e}")
+
+
+def run_streams(streams, workers):
+    stop = threading.Event()
+    # Spawned rather than forked: the reader threads must not be copied into workers
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    writer = AttendanceWriter()
+    writer_thread = threading.Thread(target=writer.run, args=(stop,), daemon=True)
+    threads = [threading.Thread(target=stream.read_loop, args=(stop,), daemon=True) for stream in streams]
+    threads.append(writer_thread)
+    if ATTENDANCE_SPOOL:
+        threads.append(threading.Thread(target=spool_flush_loop, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    in_flight = {}  # future -> stream
+    next_stats = time.monotonic() + STATS_INTERVAL
+    try:
+        while streams and not all(s.finished and s.in_flight is None and not s.has_new_frame() for s in streams):
+            now = time.monotonic()
+            due = [s for s in streams if s.in_flight is None and s.next_due <= now and s.has_new_frame()]
+            # Longest-waiting stream first
+            for stream in sorted(due, key=lambda s: s.next_due):
+                if len(in_flight) >= workers:
+                    break
+                future = pool.submit(match_frame, stream.take_frame())
+                stream.in_flight = future
+                stream.next_due = max(stream.next_due + stream.interval, now)
+                in_flight[future] = stream
+
+            if in_flight:
+                done, _ = concurrent.futures.wait(
+                    list(in_flight), timeout=0.02, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+            else:
+                done = ()
+                time.sleep(0.02)
+            for future in done:
+                stream = in_flight.pop(future)
+                stream.in_flight = None
+                stream.frames_processed += 1
+                try:
+                    matches = future.result()
+                except Exception as e:
+                    print(f"[{stream.name}] recognition error: {e}")
+                    continue
+                for db_id, _, _ in matches:
+                    if db_id is not None:
+                        stream.faces_recognized += 1
+                        writer.queue.put((stream.name, db_id))
+
+            if now >= next_stats:
+                for stream in streams:
+                    print(stream.stats_line())
+                next_stats = now + STATS_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        writer_thread.join()  # drains the queued matches
+        for stream in streams:
+            print(stream.stats_line())
+        flush_spool_on_exit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", action="append", default=[],
+                        help="device index, stream URL or video file, optionally with |<fps> (repeatable)")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="frames recognised per second per stream")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="recognition processes")
+    args = parser.parse_args()
+
+    sources = args.source or [s.strip() for s in os.getenv("CAMERA_SOURCES", "").split(",") if s.strip()]
+    if not sources:
+        sys.exit("No sources; pass --source or set CAMERA_SOURCES")
+    run_streams([CameraStream(*parse_source(spec, args.fps)) for spec in sources], max(args.workers, 1))
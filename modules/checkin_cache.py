@@ -0,0 +1,79 @@
+import os
+import time
+import threading
+from modules.database import get_db_connection
+from modules.classes import get_geofence_teachers
+from modules.queries import fetch_one
+
+# Reference rows for the check-in path, cached per process.
+#
+# With ATTENDANCE_SPOOL=1, verify_face and mark_attendance append to the spool
+# without opening a DB connection, so check-ins keep working while MySQL is
+# stalled or down. Besides the shared gallery they need a student's identity
+# and the teachers to geofence against. Both change rarely, so they are kept
+# for CHECKIN_CACHE_TTL seconds, and an expired entry is still served when
+# the refresh fails. Only a student never looked up by this process needs
+# the DB. "Not found" is not cached, so a new student works right away.
+
+CHECKIN_CACHE_TTL = int(os.getenv("CHECKIN_CACHE_TTL", "300"))  # seconds
+
+_cache = {}  # (kind, key) -> (expires_at, value); at most one entry per student
+_cache_lock = threading.Lock()
+
+
+def _cached(kind, key, load):
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get((kind, key))
+    if entry is not None and entry[0] >= now:
+        return entry[1]
+    db = None
+    try:
+        db = get_db_connection()
+        value = load(db)
+    except Exception as e:
+        if entry is None:
+            raise
+        print(f"Serving cached {kind} of {key}: {e}")
+        return entry[1]
+    finally:
+        if db is not None:
+            db.close()
+    if value is not None:
+        with _cache_lock:
+            _cache[(kind, key)] = (now + CHECKIN_CACHE_TTL, value)
+    return value
+
+
+def forget(kind=None):
+    """Drops cached entries of one kind ('identity', 'enrollment_no', 'geofence') or all."""
+    with _cache_lock:
+        for key in [k for k in _cache if kind is None or k[0] == kind]:
+            del _cache[key]
+
+
+def student_identity(student_id):
+    """(enrollment_no, full name) of a student, or None if there is no such student."""
+    def load(db):
+        row = fetch_one(db, "student.identity", (student_id,))
+        return (row[0], f"{row[1]} {row[2]}") if row else None
+    return _cached("identity", int(student_id), load)
+
+
+def student_by_enrollment_no(enrollment_no):
+    """Dict with the student's id, first_name and last_name, or None."""
+    return _cached(
+        "enrollment_no", enrollment_no,
+        lambda db: fetch_one(db, "student.by_enrollment_no", (enrollment_no,), dict_rows=True)
+    )
+
+
+def geofence_teachers(student_id):
+    """get_geofence_teachers() for the student, as dicts."""
+    def load(db):
+        cursor = db.cursor(dictionary=True)
+        try:
+            return get_geofence_teachers(cursor, student_id)
+        finally:
+            cursor.close()
+    return _cached("geofence", int(student_id), load)
@@ -0,0 +1,79 @@
+from modules.queries import cursor_fetch_all, cursor_fetch_one, placeholders
+
+# Class/section rosters.
+#
+# A teacher owns classes (one row per class + section, e.g. "10" / "A") and
+# students are linked to them through class_enrollments. Teacher queries add
+# the fragment from teacher_roster_filter() so they only touch the teacher's
+# roster. Teachers that have not set up any class keep the old whole-school
+# behaviour.
+
+
+def _scalar(row):
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def teacher_has_classes(cursor, teacher_id):
+    """False for teachers without classes, whose roster is the whole school."""
+    return bool(_scalar(cursor_fetch_one(cursor, "classes.teacher_has_classes", (teacher_id,))))
+
+
+def teacher_roster_filter(cursor, teacher_id, class_id=None, class_name=None, column="s.id", has_classes=None):
+    """
+    Returns (sql, params) to append to a WHERE clause restricting `column`
+    (a students.id expression) to the teacher's roster.
+    class_id: limit to one class/section; class_name: limit to all sections of a class.
+    Returns ("", ()) when no class is requested and the teacher has no classes.
+    has_classes: teacher_has_classes() for the teacher, if the caller already knows it.
+    """
+    if class_id is None and class_name is None:
+        if has_classes is None:
+            has_classes = teacher_has_classes(cursor, teacher_id)
+        if not has_classes:
+            return "", ()
+
+    sql = f"""AND {column} IN (
+        SELECT ce.student_id FROM class_enrollments ce
+        JOIN classes c ON c.id = ce.class_id
+        WHERE c.teacher_id = %s"""
+    params = [teacher_id]
+    if class_id is not None:
+        sql += " AND c.id = %s"
+        params.append(class_id)
+    if class_name is not None:
+        sql += " AND c.name = %s"
+        params.append(class_name)
+    sql += ")"
+    return sql, tuple(params)
+
+
+def get_geofence_teachers(cursor, student_id):
+    """
+    Teachers (id, latitude, longitude) to check a student's location against:
+    the teachers of the student's classes, or every teacher with a location
+    if the student is not enrolled anywhere.
+    """
+    teachers = cursor_fetch_all(cursor, "classes.geofence_for_student", (student_id,))
+    if teachers:
+        return teachers
+    return cursor_fetch_all(cursor, "classes.geofence_all")
+
+
+def count_students_per_teacher(cursor, student_ids):
+    """Maps teacher id -> how many of `student_ids` are on that teacher's class rosters."""
+    student_ids = list(student_ids)
+    if not student_ids:
+        return {}
+    rows = cursor_fetch_all(cursor, "classes.students_per_teacher", student_ids, ids=placeholders(student_ids))
+    counts = {}
+    for row in rows:
+        if isinstance(row, dict):
+            counts[row['teacher_id']] = int(row['students'])
+        else:
+            counts[row[0]] = int(row[1])
+    return counts
+
+
+def unscoped_teacher_ids(cursor):
+    """Ids of teachers without any class, who see the whole school."""
+    return [_scalar(row) for row in cursor_fetch_all(cursor, "classes.unscoped_teachers")]
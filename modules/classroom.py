@@ -0,0 +1,162 @@
+import base64
+import cv2
+import face_recognition
+import numpy as np
+from modules.detectors import detect_faces
+
+# Attendance from classroom photos.
+#
+# A teacher uploads one or a few high-resolution photos instead of every
+# student calling /api/verify-face. Faces are detected tile by tile (a
+# 4000px photo is far more than detectors are tuned for, and small faces at
+# the back of the room vanish when the whole photo is downscaled), encoded in
+# one face_encodings() call per photo, and matched against the roster's
+# gallery rows with a single distance matrix.
+
+TILE_SIZE = 1024
+TILE_OVERLAP = 192  # larger than the biggest face expected in a classroom photo
+NMS_IOU = 0.3
+CLASSROOM_MATCH_THRESHOLD = 0.45  # same as verify_face
+CROP_MAX_SIDE = 160
+MAX_CLASSROOM_PHOTOS = 4
+
+
+def _tiles(length, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Start offsets covering `length` with overlapping tiles."""
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def _area(box):
+    top, right, bottom, left = box
+    return (bottom - top) * (right - left)
+
+
+def _iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    return inter / float(_area(a) + _area(b) - inter)
+
+
+def tiled_face_locations(rgb_img, path="classroom"):
+    """
+    (top, right, bottom, left) boxes for every face in a large image, detected
+    per overlapping tile; faces seen by two tiles are merged, keeping the
+    larger box.
+    """
+    height, width = rgb_img.shape[:2]
+    boxes = []
+    for y in _tiles(height):
+        for x in _tiles(width):
+            tile = rgb_img[y:y + TILE_SIZE, x:x + TILE_SIZE]
+            for top, right, bottom, left in detect_faces(tile, path):
+                boxes.append((top + y, right + x, bottom + y, left + x))
+
+    boxes.sort(key=_area, reverse=True)
+    kept = []
+    for box in boxes:
+        if all(_iou(box, other) < NMS_IOU for other in kept):
+            kept.append(box)
+    return kept
+
+
+def decode_photo(data):
+    """Decoded BGR image from uploaded bytes, or None."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def roster_templates(gallery, roster_ids=None):
+    """Gallery rows (templates, ids) restricted to `roster_ids`, or all of them."""
+    if roster_ids is None:
+        return gallery.encodings, gallery.ids
+    mask = np.isin(gallery.ids, np.asarray(list(roster_ids), dtype=np.int64))
+    return gallery.encodings[mask], gallery.ids[mask]
+
+
+def distance_matrix(faces, templates):
+    """(F, T) Euclidean distances between face encodings and gallery rows, in one matrix product."""
+    faces = np.asarray(faces, dtype=np.float32)
+    templates = np.asarray(templates, dtype=np.float32)
+    squared = (
+        np.sum(faces ** 2, axis=1)[:, None]
+        + np.sum(templates ** 2, axis=1)[None, :]
+        - 2.0 * faces @ templates.T
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def match_faces(faces, templates, template_ids, threshold=CLASSROOM_MATCH_THRESHOLD):
+    """
+    Assigns faces to students. template_ids must be sorted (a student's
+    templates contiguous), as in the shared gallery. Each student and each
+    face is used at most once, closest pairs first.
+    Returns {face index: (student id, distance)}.
+    """
+    if not len(faces) or not len(template_ids):
+        return {}
+    distances = distance_matrix(faces, templates)
+
+    # Per-student minimum over that student's templates
+    template_ids = np.asarray(template_ids)
+    starts = np.flatnonzero(np.r_[True, template_ids[1:] != template_ids[:-1]])
+    student_ids = template_ids[starts]
+    per_student = np.minimum.reduceat(distances, starts, axis=1)
+
+    face_idx, student_idx = np.nonzero(per_student <= threshold)
+    order = np.argsort(per_student[face_idx, student_idx], kind="stable")
+    matches = {}
+    used_students = set()
+    for i in order:
+        face, student = int(face_idx[i]), int(student_idx[i])
+        if face in matches or student in used_students:
+            continue
+        matches[face] = (int(student_ids[student]), float(per_student[face, student]))
+        used_students.add(student)
+    return matches
+
+
+def face_crop_data_url(bgr_img, location):
+    """Small JPEG data URL of one face, for reviewing unmatched faces."""
+    top, right, bottom, left = location
+    crop = bgr_img[top:bottom, left:right]
+    scale = CROP_MAX_SIDE / float(max(crop.shape[:2]))
+    if scale < 1.0:
+        crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    jpeg = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode()
+
+
+def recognize_photos(images, templates, template_ids):
+    """
+    Detects, encodes and matches the faces in decoded BGR `images`.
+    Returns (matched, unmatched): matched is a list of dicts with student_id,
+    distance, photo and box; unmatched is a list with photo, box and crop.
+    """
+    faces = []
+    encodings = []
+    for photo, bgr_img in enumerate(images):
+        rgb_img = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2RGB)
+        locations = tiled_face_locations(rgb_img)
+        if not locations:
+            continue
+        encodings.extend(face_recognition.face_encodings(rgb_img, locations))
+        faces.extend((photo, location) for location in locations)
+
+    matches = match_faces(encodings, templates, template_ids)
+    matched, unmatched = [], []
+    for i, (photo, location) in enumerate(faces):
+        if i in matches:
+            student_id, distance = matches[i]
+            matched.append({'student_id': student_id, 'distance': round(distance, 4),
+                            'photo': photo, 'box': list(location)})
+        else:
+            unmatched.append({'photo': photo, 'box': list(location),
+                              'crop': face_crop_data_url(images[photo], location)})
+    return matched, unmatched
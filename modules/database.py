@@ -1,12 +1,40 @@
 import os
+import sys
+import csv
+import gzip
+import time
+import argparse
+import datetime
+import threading
 import mysql.connector
+import mysql.connector.pooling
 from dotenv import load_dotenv
 
 # Load variables from a local .env file if present (not committed)
 load_dotenv()
 
-def get_db_connection():
-    connection = mysql.connector.connect(
+# "mysql" (default) or "sqlite" for the embedded backend in modules/sqlite_backend.py
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "educonnect.db")
+
+# Monthly RANGE partitioning of `attendance` is opt-in because the first
+# conversion rewrites the whole table (see partition_attendance_table).
+ATTENDANCE_PARTITIONING = os.getenv("ATTENDANCE_PARTITIONING", "0") == "1"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+SCHOOL_YEAR_START_MONTH = int(os.getenv("SCHOOL_YEAR_START_MONTH", "6"))
+ARCHIVE_DELETE_BATCH = 10000
+
+# Connections per process kept open for reuse; 0 opens a new connection per call.
+# Pooled connections keep their session (and so the prepared statements of
+# modules/queries.py) between requests; any leftover transaction is rolled
+# back when a connection is handed out.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _connection_settings():
+    return dict(
         host=os.getenv("DB_HOST", "localhost"),
         port=int(os.getenv("DB_PORT", "3306")),
         user=os.getenv("DB_USER", "root"),
@@ -14,9 +42,55 @@ def get_db_connection():
         database=os.getenv("DB_NAME", "educonnect"),
         ssl_ca=os.getenv("DB_SSL_CA") or None,
     )
+
+def get_db_connection():
+    global _pool
+    if DB_BACKEND == "sqlite":
+        # Imported lazily; MySQL deployments never load it
+        from modules import sqlite_backend
+        return sqlite_backend.connect(SQLITE_PATH)
+    if DB_POOL_SIZE > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name=f"educonnect-{os.getpid()}", pool_size=min(DB_POOL_SIZE, 32),
+                    pool_reset_session=False, **_connection_settings()
+                )
+        try:
+            connection = _pool.get_connection()
+            connection.rollback()
+            return connection
+        except mysql.connector.errors.PoolError:
+            pass  # all pooled connections busy; fall back to a one-off connection
+    connection = mysql.connector.connect(**_connection_settings())
     return connection
 
+def _ensure_index(cursor, table, index_name, columns, unique=False):
+    """Adds an index to an existing table if it is not there yet."""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index_name))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index_name} ON {table} ({columns})")
+
+def _ensure_column(cursor, table, column, definition):
+    """Adds a column to an existing table if it is not there yet."""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 def create_tables():
+    if DB_BACKEND == "sqlite":
+        from modules import sqlite_backend
+        db = get_db_connection()
+        sqlite_backend.create_tables(db)
+        db.close()
+        return
+
     db = get_db_connection()
     cursor = db.cursor()
     
@@ -60,16 +134,317 @@ def create_tables():
             FOREIGN KEY (student_id) REFERENCES students(id)
         )
     """)
+    _ensure_index(cursor, "attendance", "idx_attendance_student_marked", "student_id, marked_at")
+    _ensure_index(cursor, "attendance", "idx_attendance_marked_status", "marked_at, status")
+    _ensure_index(cursor, "students", "idx_students_first_name", "first_name")
+    _ensure_index(cursor, "students", "idx_students_last_name", "last_name")
+    # High-water mark for the gallery snapshot catch-up (modules/gallery.py)
+    _ensure_column(cursor, "students", "face_updated_at", "TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP")
+    _ensure_index(cursor, "students", "idx_students_face_updated", "face_updated_at")
+
+    # Per-student monthly rollup, maintained by modules/rollup.py on every attendance write
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_monthly (
+            student_id INT NOT NULL,
+            year SMALLINT NOT NULL,
+            month TINYINT NOT NULL,
+            present_days SMALLINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (student_id, year, month),
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        )
+    """)
+    # Backfill months that predate the rollup table; existing rows are left alone
+    cursor.execute("""
+        INSERT IGNORE INTO attendance_monthly (student_id, year, month, present_days)
+        SELECT student_id, YEAR(marked_at), MONTH(marked_at), COUNT(DISTINCT DATE(marked_at))
+        FROM attendance
+        WHERE status = 'Present' AND marked_at IS NOT NULL
+        GROUP BY student_id, YEAR(marked_at), MONTH(marked_at)
+    """)
     
+    # Class/section rosters used to scope teacher queries (see modules/classes.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS classes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            teacher_id INT NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            section VARCHAR(50) NOT NULL DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_classes_teacher_name_section (teacher_id, name, section),
+            FOREIGN KEY (teacher_id) REFERENCES teachers(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS class_enrollments (
+            class_id INT NOT NULL,
+            student_id INT NOT NULL,
+            enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (class_id, student_id),
+            INDEX idx_class_enrollments_student (student_id),
+            FOREIGN KEY (class_id) REFERENCES classes(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        )
+    """)
+
+    # Extra face templates learned from verifications (see modules/templates.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS face_templates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            student_id INT NOT NULL,
+            encoding BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_face_templates_student (student_id),
+            FOREIGN KEY (student_id) REFERENCES students(id)
+        )
+    """)
+
+    # Last spooled row applied per spool file (see modules/spool.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_spool_progress (
+            spool_id VARCHAR(128) PRIMARY KEY,
+            applied_seq BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS manual_attendance_requests (
             id INT AUTO_INCREMENT PRIMARY KEY,
             student_id INT NOT NULL,
+            request_date DATE,
             requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (student_id) REFERENCES students(id)
         )
     """)
+    # One pending request per student per day (see modules/manual_requests.py);
+    # older tables get the column backfilled and their duplicates dropped first
+    _ensure_column(cursor, "manual_attendance_requests", "request_date", "DATE")
+    cursor.execute("UPDATE manual_attendance_requests SET request_date = DATE(requested_at) WHERE request_date IS NULL")
+    cursor.execute("""
+        DELETE r FROM manual_attendance_requests r
+        JOIN manual_attendance_requests keep
+            ON keep.student_id = r.student_id AND keep.request_date = r.request_date AND keep.id < r.id
+    """)
+    _ensure_index(cursor, "manual_attendance_requests", "uq_manual_requests_student_day",
+                  "student_id, request_date", unique=True)
+    _ensure_index(cursor, "manual_attendance_requests", "idx_manual_requests_requested", "requested_at")
     
+    if ATTENDANCE_PARTITIONING:
+        partition_attendance_table(cursor)
+        ensure_future_partitions(cursor)
+
     db.commit()
     cursor.close()
-    db.close()
\ No newline at end of file
+    db.close()
+
+def _add_months(day, months):
+    """First day of the month `months` after the month containing `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def _partition_name(month_start):
+    return f"p{month_start.year}{month_start.month:02d}"
+
+def _partition_clause(month_start):
+    """Partition holding rows marked during the month starting at month_start."""
+    upper = _add_months(month_start, 1)
+    return f"PARTITION {_partition_name(month_start)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper.isoformat()} 00:00:00'))"
+
+def _attendance_partitions(cursor):
+    """Names of the existing attendance partitions ([] if the table is not partitioned)."""
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'attendance' AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def partition_attendance_table(cursor):
+    """
+    Converts `attendance` to RANGE partitioning by month of marked_at.
+    MySQL requires the partitioning column in every unique key and does not
+    allow foreign keys on partitioned tables, so the FK to students is dropped,
+    marked_at becomes NOT NULL and the primary key becomes (id, marked_at).
+    Does nothing if the table is already partitioned.
+    """
+    if DB_BACKEND != "mysql":
+        raise RuntimeError("Attendance partitioning is only available on MySQL")
+    if _attendance_partitions(cursor):
+        return
+
+    cursor.execute("""
+        SELECT constraint_name FROM information_schema.referential_constraints
+        WHERE constraint_schema = DATABASE() AND table_name = 'attendance'
+    """)
+    for (constraint_name,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE attendance DROP FOREIGN KEY {constraint_name}")
+
+    cursor.execute("UPDATE attendance SET marked_at = COALESCE(created_at, NOW()) WHERE marked_at IS NULL")
+    cursor.execute("""
+        ALTER TABLE attendance
+            MODIFY marked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, marked_at)
+    """)
+
+    cursor.execute("SELECT MIN(marked_at) FROM attendance")
+    oldest = cursor.fetchone()[0]
+    first_month = (oldest.date() if oldest else datetime.date.today()).replace(day=1)
+    last_month = _add_months(datetime.date.today(), PARTITION_MONTHS_AHEAD)
+
+    clauses = []
+    month = first_month
+    while month <= last_month:
+        clauses.append(_partition_clause(month))
+        month = _add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    cursor.execute(
+        "ALTER TABLE attendance PARTITION BY RANGE (UNIX_TIMESTAMP(marked_at)) (" + ", ".join(clauses) + ")"
+    )
+
+def ensure_future_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Splits pmax so that partitions exist through `months_ahead` months from now."""
+    if DB_BACKEND != "mysql":
+        return
+    existing = set(_attendance_partitions(cursor))
+    if not existing:
+        return
+
+    missing = []
+    month = datetime.date.today().replace(day=1)
+    for _ in range(months_ahead + 1):
+        if _partition_name(month) not in existing:
+            missing.append(month)
+        month = _add_months(month, 1)
+    if not missing:
+        return
+
+    # REORGANIZE moves any rows already sitting in pmax into the new month partitions
+    clauses = [_partition_clause(m) for m in missing]
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    cursor.execute("ALTER TABLE attendance REORGANIZE PARTITION pmax INTO (" + ", ".join(clauses) + ")")
+
+def partition_maintenance_loop(sleep=time.sleep, interval=24 * 60 * 60):
+    """Creates upcoming partitions once a day; meant to run as a background task."""
+    while True:
+        try:
+            db = get_db_connection()
+            cursor = db.cursor()
+            try:
+                ensure_future_partitions(cursor)
+            finally:
+                cursor.close()
+                db.close()
+        except Exception as e:
+            print(f"Partition maintenance error: {e}")
+        sleep(interval)
+
+def school_year_bounds(start_year):
+    """(first_day, first_day_of_next_school_year) for the school year starting in start_year."""
+    first_day = datetime.date(start_year, SCHOOL_YEAR_START_MONTH, 1)
+    return first_day, _add_months(first_day, 12)
+
+def archive_school_year(start_year, csv_path=None):
+    """
+    Moves attendance rows of a closed school year out of the hot table, either
+    into the compressed `attendance_archive` table or into a gzipped CSV file.
+    Whole month partitions are dropped when the table is partitioned;
+    otherwise rows are deleted in small batches. Returns the number of rows archived.
+    """
+    if DB_BACKEND != "mysql":
+        raise ValueError("Archiving is only available on MySQL")
+    first_day, end_day = school_year_bounds(start_year)
+    if end_day > datetime.date.today():
+        raise ValueError(f"School year {start_year} is not closed yet (ends {end_day.isoformat()})")
+
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        if csv_path:
+            cursor.execute("""
+                SELECT id, student_id, enrollment_no, name, status, marked_at, created_at
+                FROM attendance WHERE marked_at >= %s AND marked_at < %s ORDER BY marked_at
+            """, (first_day, end_day))
+            archived = 0
+            with gzip.open(csv_path, "wt", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([column[0] for column in cursor.description])
+                rows = cursor.fetchmany(ARCHIVE_DELETE_BATCH)
+                while rows:
+                    writer.writerows(rows)
+                    archived += len(rows)
+                    rows = cursor.fetchmany(ARCHIVE_DELETE_BATCH)
+        else:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS attendance_archive (
+                    id INT NOT NULL,
+                    student_id INT NOT NULL,
+                    enrollment_no VARCHAR(50),
+                    name VARCHAR(200),
+                    status VARCHAR(50),
+                    marked_at TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP NULL,
+                    PRIMARY KEY (id, marked_at),
+                    INDEX idx_attendance_archive_student (student_id, marked_at)
+                ) ROW_FORMAT=COMPRESSED
+            """)
+            cursor.execute("""
+                INSERT IGNORE INTO attendance_archive
+                    (id, student_id, enrollment_no, name, status, marked_at, created_at)
+                SELECT id, student_id, enrollment_no, name, status, marked_at, created_at
+                FROM attendance WHERE marked_at >= %s AND marked_at < %s
+            """, (first_day, end_day))
+            archived = cursor.rowcount
+            db.commit()
+
+        partitions = set(_attendance_partitions(cursor))
+        if partitions:
+            month = first_day
+            to_drop = []
+            while month < end_day:
+                if _partition_name(month) in partitions:
+                    to_drop.append(_partition_name(month))
+                month = _add_months(month, 1)
+            if to_drop:
+                cursor.execute("ALTER TABLE attendance DROP PARTITION " + ", ".join(to_drop))
+        # Rows not covered by a dropped partition (or an unpartitioned table)
+        while True:
+            cursor.execute(
+                "DELETE FROM attendance WHERE marked_at >= %s AND marked_at < %s LIMIT %s",
+                (first_day, end_day, ARCHIVE_DELETE_BATCH)
+            )
+            db.commit()
+            if cursor.rowcount < ARCHIVE_DELETE_BATCH:
+                break
+        return archived
+    finally:
+        cursor.close()
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EduConnect database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create-tables", help="create or migrate the schema")
+    commands.add_parser("partition", help="partition attendance by month and create upcoming partitions")
+    archive_parser = commands.add_parser("archive", help="move a closed school year out of the attendance table")
+    archive_parser.add_argument("--school-year", type=int, required=True, help="year the school year starts in")
+    archive_parser.add_argument("--csv", help="write a gzipped CSV here instead of the attendance_archive table")
+    args = parser.parse_args()
+
+    if args.command == "create-tables":
+        create_tables()
+    elif args.command == "partition":
+        db = get_db_connection()
+        cursor = db.cursor()
+        partition_attendance_table(cursor)
+        ensure_future_partitions(cursor)
+        cursor.close()
+        db.close()
+    elif args.command == "archive":
+        try:
+            count = archive_school_year(args.school_year, args.csv)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"Archived {count} attendance rows for school year {args.school_year}")
\ No newline at end of file
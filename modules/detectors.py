@@ -0,0 +1,151 @@
+import os
+import threading
+import cv2
+import face_recognition
+
+# Face detector backends.
+#
+# Every path detects faces through detect_faces(rgb_img, path) and gets
+# face_recognition-style (top, right, bottom, left) boxes back, so the
+# result can go straight into face_recognition.face_encodings(). The backend
+# for each path is set with DETECTOR_<PATH> (camera, verify, register,
+# classroom):
+#
+#     hog   dlib HOG via face_recognition (the previous behaviour, default)
+#     haar  OpenCV Haar cascade, fastest, more misses on tilted faces
+#     lbp   OpenCV LBP cascade (DETECTOR_LBP_CASCADE must point at the XML)
+#     dnn   OpenCV DNN ResNet-10 SSD on CPU (DETECTOR_DNN_PROTOTXT and
+#           DETECTOR_DNN_MODEL must point at the Caffe files)
+#
+# Appending @<scale> (e.g. "hog@0.5") detects on a resized copy and maps the
+# boxes back, which trades small faces for speed. A typical setup is
+# DETECTOR_CAMERA=haar or dnn for the live loop and DETECTOR_REGISTER=hog for
+# enrollment. `python -m benchmarks.recognition run --detectors hog,haar,dnn`
+# compares them on the recorded fixtures.
+
+DETECTOR_PATHS = ("camera", "verify", "register", "classroom")
+DEFAULT_DETECTOR = "hog"
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+class HogDetector:
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def __call__(self, rgb_img):
+        return face_recognition.face_locations(rgb_img, number_of_times_to_upsample=self.upsample, model="hog")
+
+
+class CascadeDetector:
+    def __init__(self, cascade_path, scale_factor=1.1, min_neighbors=5, min_size=(40, 40)):
+        self.classifier = cv2.CascadeClassifier(cascade_path)
+        if self.classifier.empty():
+            raise ValueError(f"Could not load cascade {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        # CascadeClassifier is not safe to share between threads
+        self._lock = threading.Lock()
+
+    def __call__(self, rgb_img):
+        gray = cv2.equalizeHist(cv2.cvtColor(rgb_img, cv2.COLOR_RGB2GRAY))
+        with self._lock:
+            boxes = self.classifier.detectMultiScale(
+                gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=self.min_size
+            )
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in boxes]
+
+
+class DnnSsdDetector:
+    INPUT_SIZE = (300, 300)
+    # Training mean of the ResNet-10 SSD, which was trained on BGR (Caffe) input
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, prototxt, model, confidence=0.5):
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+        self._lock = threading.Lock()
+
+    def __call__(self, rgb_img):
+        height, width = rgb_img.shape[:2]
+        bgr_img = cv2.cvtColor(cv2.resize(rgb_img, self.INPUT_SIZE), cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(bgr_img, 1.0, self.INPUT_SIZE, self.MEAN, swapRB=False)
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()
+
+        locations = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.confidence:
+                continue
+            left, top, right, bottom = detections[0, 0, i, 3:7] * (width, height, width, height)
+            top, left = max(int(top), 0), max(int(left), 0)
+            bottom, right = min(int(bottom), height - 1), min(int(right), width - 1)
+            if bottom > top and right > left:
+                locations.append((top, right, bottom, left))
+        return locations
+
+
+class ScaledDetector:
+    """Runs `detector` on a copy resized by `scale` and maps boxes back."""
+
+    def __init__(self, detector, scale):
+        self.detector = detector
+        self.scale = scale
+
+    def __call__(self, rgb_img):
+        small = cv2.resize(rgb_img, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return [
+            tuple(int(round(v / self.scale)) for v in location)
+            for location in self.detector(small)
+        ]
+
+
+def create_detector(spec):
+    """Builds a detector from a spec such as "hog", "dnn" or "haar@0.5"."""
+    name, _, scale = spec.strip().lower().partition("@")
+    if name == "hog":
+        detector = HogDetector()
+    elif name == "haar":
+        detector = CascadeDetector(os.getenv(
+            "DETECTOR_HAAR_CASCADE", os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        ))
+    elif name == "lbp":
+        detector = CascadeDetector(os.getenv("DETECTOR_LBP_CASCADE", "models/lbpcascade_frontalface_improved.xml"))
+    elif name == "dnn":
+        detector = DnnSsdDetector(
+            os.getenv("DETECTOR_DNN_PROTOTXT", "models/deploy.prototxt"),
+            os.getenv("DETECTOR_DNN_MODEL", "models/res10_300x300_ssd_iter_140000.caffemodel"),
+            confidence=float(os.getenv("DETECTOR_DNN_CONFIDENCE", "0.5")),
+        )
+    else:
+        raise ValueError(f"Unknown face detector '{spec}'")
+    if scale and float(scale) != 1.0:
+        detector = ScaledDetector(detector, float(scale))
+    return detector
+
+
+def detector_spec(path):
+    """Configured detector spec for a path (one of DETECTOR_PATHS)."""
+    return os.getenv(f"DETECTOR_{path.upper()}", DEFAULT_DETECTOR)
+
+
+def get_detector(spec):
+    """Cached detector for `spec`; falls back to HOG if the backend cannot be loaded."""
+    with _detectors_lock:
+        if spec not in _detectors:
+            try:
+                _detectors[spec] = create_detector(spec)
+            except Exception as e:
+                print(f"Face detector '{spec}' unavailable, using {DEFAULT_DETECTOR}: {e}")
+                _detectors[spec] = create_detector(DEFAULT_DETECTOR)
+        return _detectors[spec]
+
+
+def detect_faces(rgb_img, path):
+    """(top, right, bottom, left) boxes for every face, using the detector configured for `path`."""
+    return get_detector(detector_spec(path))(rgb_img)
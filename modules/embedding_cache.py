@@ -0,0 +1,88 @@
+import os
+import time
+import hashlib
+import threading
+import collections
+import cv2
+import face_recognition
+import numpy as np
+from modules.detectors import detect_faces, detector_spec
+
+# Face encodings of recently seen uploads, keyed by a digest of the image bytes.
+#
+# The same capture often reaches the server more than once: a verify-face
+# retry after a network error, the offline copy posted again by sync, or
+# student.js posting one photo to both endpoints. encode_image_bytes() runs
+# detection and encoding once per distinct image and serves repeats from a
+# bounded LRU with a TTL. "No face found" results are cached as well, so
+# retrying an unusable photo is just as cheap.
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "256"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "600"))  # seconds
+
+_cache = collections.OrderedDict()  # (detector spec, digest) -> (expires_at, encoding or None)
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+
+def image_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _lookup(key):
+    """Returns (found, encoding)."""
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return False, None
+        expires_at, encoding = entry
+        if expires_at < time.monotonic():
+            del _cache[key]
+            _stats["expired"] += 1
+            _stats["misses"] += 1
+            return False, None
+        _cache.move_to_end(key)
+        _stats["hits"] += 1
+        return True, encoding
+
+
+def _store(key, encoding):
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + EMBEDDING_CACHE_TTL, encoding)
+        _cache.move_to_end(key)
+        while len(_cache) > EMBEDDING_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def encode_image_bytes(data, path="verify"):
+    """
+    Face encoding of the first face in an encoded image (JPEG/PNG bytes), or
+    None if it cannot be decoded or has no face. Faces are found with the
+    detector configured for `path`. Cached by image digest and detector; the
+    returned array is read-only.
+    """
+    key = (detector_spec(path), image_digest(data))
+    found, encoding = _lookup(key)
+    if found:
+        return encoding
+
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    encoding = None
+    if img is not None:
+        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        encodings = face_recognition.face_encodings(rgb_img, detect_faces(rgb_img, path))
+        if encodings:
+            encoding = encodings[0]
+            encoding.setflags(write=False)
+    _store(key, encoding)
+    return encoding
+
+
+def embedding_cache_stats():
+    with _cache_lock:
+        stats = dict(_stats, size=len(_cache), capacity=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    return stats
@@ -0,0 +1,38 @@
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+# Advisory file locks shared across worker and camera processes.
+#
+# Used by the gallery publisher and snapshots, the per-day version counters,
+# the attendance spool and the leader guard. A lock lasts until it is
+# released or its file is closed, so a process that dies never leaves one
+# behind. Without fcntl (Windows) every lock is granted.
+
+
+def lock(f, blocking=True):
+    """
+    Takes an exclusive flock on an open file (or descriptor). With
+    blocking=False returns False instead of waiting when another process
+    holds it.
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Holds an exclusive lock on the lock file at `path` (created, with its directory) for the with block."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as lock_file:
+        lock(lock_file)
+        yield
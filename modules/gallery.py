@@ -0,0 +1,359 @@
+import os
+import sys
+import json
+import time
+import pickle
+import datetime
+import tempfile
+import threading
+import numpy as np
+from modules.database import get_db_connection
+from modules.filelock import locked
+from modules.queries import cursor_fetch_all
+
+# Face gallery shared by every worker process.
+#
+# The gallery is published as two .npy files per generation, a float32
+# (N, 128) template matrix and a sorted int64 array of the students.id each
+# row belongs to. A student has one row per template, stored next to each
+# other: the registration encoding first, then any in face_templates. A small
+# CURRENT file names the live generation. Workers np.load() them with
+# mmap_mode='r', so all processes share the same page-cache pages read-only
+# instead of each unpickling its own copy. Updates write a new generation and
+# swap CURRENT atomically. Readers notice the new number on their next
+# get_gallery() call, so no reload or restart is needed.
+#
+# /dev/shm does not survive a reboot, so the gallery is also snapshotted to
+# SNAPSHOT_DIR on disk with a high-water mark (largest students.id and the DB
+# time the snapshot was taken). A cold start maps the snapshot and only reads
+# students added, re-registered or given a new template since then
+# (students.face_updated_at).
+
+GALLERY_DIR = os.getenv("GALLERY_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "educonnect-gallery"
+)
+ENCODING_DIM = 128
+KEEP_GENERATIONS = 2
+
+SNAPSHOT_DIR = os.getenv("GALLERY_SNAPSHOT_DIR", "gallery_snapshot")
+SNAPSHOT_INTERVAL = int(os.getenv("GALLERY_SNAPSHOT_INTERVAL", "300"))  # seconds
+# Re-read rows touched shortly before a snapshot in case they were committed
+# to the DB but not yet published to the gallery when it was taken
+SNAPSHOT_CATCHUP_MARGIN = datetime.timedelta(seconds=60)
+
+_current = None
+_current_lock = threading.Lock()
+_snapshot_generation = None
+
+
+class Gallery:
+    """Read-only view of one gallery generation."""
+
+    def __init__(self, generation, encodings, ids):
+        self.generation = generation
+        self.encodings = encodings
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, student_id):
+        """Slice of the student's rows in the matrix (empty if unknown)."""
+        start = int(np.searchsorted(self.ids, student_id, side="left"))
+        end = int(np.searchsorted(self.ids, student_id, side="right"))
+        return slice(start, end)
+
+    def templates_for(self, student_id):
+        """(k, 128) matrix of the student's templates, or None."""
+        rows = self.rows_for(student_id)
+        return self.encodings[rows] if rows.stop > rows.start else None
+
+
+def _path(name):
+    return os.path.join(GALLERY_DIR, name)
+
+
+def _generation_files(generation):
+    return _path(f"encodings-{generation}.npy"), _path(f"ids-{generation}.npy")
+
+
+def _read_generation():
+    try:
+        with open(_path("CURRENT")) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _publish_lock():
+    """Serialises publishers across processes."""
+    return locked(_path("publish.lock"))
+
+
+def _write_atomic(path, writer):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+
+def _publish_locked(encodings, ids):
+    """Writes a new generation and makes it current; caller holds _publish_lock."""
+    generation = (_read_generation() or 0) + 1
+    encodings_path, ids_path = _generation_files(generation)
+    _write_atomic(encodings_path, lambda f: np.save(f, np.ascontiguousarray(encodings, dtype=np.float32)))
+    _write_atomic(ids_path, lambda f: np.save(f, np.ascontiguousarray(ids, dtype=np.int64)))
+    _write_atomic(_path("CURRENT"), lambda f: f.write(str(generation).encode()))
+
+    # Readers still mapping an old generation keep their mapping after unlink
+    for name in os.listdir(GALLERY_DIR):
+        prefix, _, suffix = name.partition("-")
+        if prefix not in ("encodings", "ids") or not suffix.endswith(".npy"):
+            continue
+        try:
+            if int(suffix[:-4]) <= generation - KEEP_GENERATIONS:
+                os.remove(_path(name))
+        except (ValueError, OSError):
+            pass
+    return generation
+
+
+def publish(encodings, ids):
+    """Publishes a new generation from an (N, 128) matrix and matching students.id array."""
+    order = np.argsort(ids, kind="stable")
+    with _publish_lock():
+        return _publish_locked(np.asarray(encodings)[order], np.asarray(ids)[order])
+
+
+def _load_shared(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Empty galleries cannot be memory-mapped on some numpy versions
+        return np.load(path)
+
+
+def _attach(generation):
+    encodings_path, ids_path = _generation_files(generation)
+    return Gallery(generation, _load_shared(encodings_path), _load_shared(ids_path))
+
+
+def load_templates(cursor, student_filter="", params=()):
+    """
+    Registration encodings plus face_templates rows as (matrix, ids), each
+    student's registration encoding first.
+    student_filter: optional "AND ..." fragment on the student id column,
+    written as {sid}. It is applied inside both halves of the UNION (params
+    are passed once per half) so a per-student load reads only that
+    student's rows instead of materializing every blob first.
+    """
+    rows = cursor_fetch_all(
+        cursor, "gallery.templates", tuple(params) * 2,
+        students=student_filter.format(sid="id"), templates=student_filter.format(sid="student_id"),
+    )
+    encodings = np.empty((len(rows), ENCODING_DIM), dtype=np.float32)
+    ids = np.empty(len(rows), dtype=np.int64)
+    for i, row in enumerate(rows):
+        student_id, blob = (row['sid'], row['encoding']) if isinstance(row, dict) else row[:2]
+        encodings[i] = pickle.loads(blob)
+        ids[i] = student_id
+    return encodings, ids
+
+
+def load_gallery_from_db():
+    """Reads and unpickles every stored template; returns (matrix, ids)."""
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        return load_templates(cursor)
+    finally:
+        cursor.close()
+        db.close()
+
+
+def rebuild_gallery():
+    """Publishes a fresh generation built from the students table."""
+    return publish(*load_gallery_from_db())
+
+
+def _snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+def load_snapshot():
+    """Maps the on-disk snapshot; returns (encodings, ids, meta) or None."""
+    try:
+        with open(_snapshot_path("snapshot.json")) as f:
+            meta = json.load(f)
+        encodings = _load_shared(_snapshot_path(f"snapshot-{meta['token']}-encodings.npy"))
+        ids = _load_shared(_snapshot_path(f"snapshot-{meta['token']}-ids.npy"))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Gallery snapshot not used: {e}")
+        return None
+    if len(ids) != meta.get("count") or encodings.shape != (len(ids), ENCODING_DIM):
+        print("Gallery snapshot not used: files do not match snapshot.json")
+        return None
+    return encodings, ids, meta
+
+
+def catch_up(encodings, ids, meta):
+    """
+    Reloads every template of students added, re-registered or given a new
+    template since the snapshot; returns (matrix, ids).
+    """
+    synced_at = datetime.datetime.fromisoformat(meta["synced_at"]) - SNAPSHOT_CATCHUP_MARGIN
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        changed, changed_ids = load_templates(
+            cursor,
+            "AND {sid} IN (SELECT id FROM students WHERE id > %s OR face_updated_at >= %s)",
+            (meta["max_id"], synced_at),
+        )
+    finally:
+        cursor.close()
+        db.close()
+    if not len(changed_ids):
+        return encodings, ids
+
+    keep = ~np.isin(ids, changed_ids)
+    encodings = np.concatenate([np.asarray(encodings)[keep], changed])
+    ids = np.concatenate([np.asarray(ids)[keep], changed_ids])
+    order = np.argsort(ids, kind="stable")
+    return encodings[order], ids[order]
+
+
+def load_gallery():
+    """Snapshot plus catch-up when a snapshot exists, otherwise a full table read."""
+    snapshot = load_snapshot()
+    if snapshot is None:
+        return load_gallery_from_db()
+    return catch_up(*snapshot)
+
+
+def _db_now():
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT NOW()")
+        now = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        db.close()
+    return now if isinstance(now, datetime.datetime) else datetime.datetime.fromisoformat(str(now))
+
+
+def save_snapshot(force=False):
+    """
+    Writes the live gallery to SNAPSHOT_DIR unless this process already saved
+    the same generation. Returns True if a snapshot was written.
+    """
+    global _snapshot_generation
+    # Taken before reading the gallery so later changes fall after the mark
+    synced_at = _db_now()
+    gallery = get_gallery()
+    if not force and gallery.generation == _snapshot_generation:
+        return False
+
+    token = f"{int(time.time() * 1000)}-{os.getpid()}"
+    with locked(_snapshot_path("snapshot.lock")):
+        _write_atomic(_snapshot_path(f"snapshot-{token}-encodings.npy"),
+                      lambda f: np.save(f, np.ascontiguousarray(gallery.encodings, dtype=np.float32)))
+        _write_atomic(_snapshot_path(f"snapshot-{token}-ids.npy"),
+                      lambda f: np.save(f, np.ascontiguousarray(gallery.ids, dtype=np.int64)))
+        meta = {
+            "token": token,
+            "count": len(gallery),
+            "max_id": int(gallery.ids[-1]) if len(gallery) else 0,
+            "synced_at": synced_at.isoformat(" "),
+        }
+        _write_atomic(_snapshot_path("snapshot.json"), lambda f: f.write(json.dumps(meta).encode()))
+
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.startswith("snapshot-") and not name.startswith(f"snapshot-{token}-"):
+                try:
+                    os.remove(_snapshot_path(name))
+                except OSError:
+                    pass
+    _snapshot_generation = gallery.generation
+    return True
+
+
+def snapshot_loop(sleep=time.sleep, interval=SNAPSHOT_INTERVAL):
+    """Saves the gallery snapshot whenever it changed; meant to run as a background task."""
+    while True:
+        try:
+            save_snapshot()
+        except Exception as e:
+            print(f"Gallery snapshot error: {e}")
+        sleep(interval)
+
+
+def save_snapshot_on_exit():
+    """atexit hook: a failed final snapshot only costs a longer catch-up."""
+    try:
+        save_snapshot()
+    except Exception as e:
+        print(f"Gallery snapshot error: {e}")
+
+
+def get_gallery():
+    """
+    Returns the current gallery, attaching to a newer generation if one was
+    published. The first caller across all workers builds it from the
+    snapshot (or the DB if there is none).
+    """
+    global _current
+    generation = _read_generation()
+    if generation is None:
+        with _publish_lock():
+            generation = _read_generation()
+            if generation is None:
+                generation = _publish_locked(*load_gallery())
+
+    gallery = _current
+    if gallery is not None and gallery.generation == generation:
+        return gallery
+    with _current_lock:
+        if _current is None or _current.generation != generation:
+            try:
+                _current = _attach(generation)
+            except OSError:
+                # Superseded and cleaned up between reading CURRENT and loading
+                _current = _attach(_read_generation())
+        return _current
+
+
+def set_student_templates(student_id, templates):
+    """Replaces all of one student's rows with `templates` and publishes a new generation."""
+    templates = np.asarray(templates, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    return set_templates([student_id], templates, np.full(len(templates), student_id, dtype=np.int64))
+
+
+def set_templates(student_ids, encodings, ids):
+    """
+    Replaces all rows of `student_ids` with `encodings` (rows for `ids`, each
+    student's in order) in a single new generation, so a batch of changes
+    costs one copy of the gallery.
+    """
+    get_gallery()
+    with _publish_lock():
+        current = _attach(_read_generation())
+        keep = ~np.isin(current.ids, np.asarray(list(student_ids), dtype=np.int64))
+        encodings = np.concatenate([
+            current.encodings[keep], np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        ])
+        ids = np.concatenate([current.ids[keep], np.asarray(ids, dtype=np.int64)])
+        order = np.argsort(ids, kind="stable")
+        return _publish_locked(encodings[order], ids[order])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rebuild"]:
+        generation = rebuild_gallery()
+        print(f"Published gallery generation {generation} in {GALLERY_DIR}")
+    elif sys.argv[1:] == ["snapshot"]:
+        save_snapshot(force=True)
+        print(f"Saved gallery snapshot in {SNAPSHOT_DIR}")
+    else:
+        sys.exit("usage: python -m modules.gallery {rebuild,snapshot}")
@@ -0,0 +1,41 @@
+import os
+import time
+import tempfile
+from modules.filelock import lock
+
+# Single-runner guard for background tasks.
+#
+# Every worker of a WSGI server imports main.py, so maintenance that should
+# run once per host (gallery snapshots, partition upkeep) is started in all of
+# them through run_as_leader(). The first process to take an exclusive flock
+# on LEADER_LOCK_DIR/educonnect-<name>.lock runs the task and holds the lock
+# until it exits; the others retry every LEADER_RETRY seconds, so another
+# worker takes over when the leader is recycled.
+
+LEADER_LOCK_DIR = os.getenv("LEADER_LOCK_DIR") or tempfile.gettempdir()
+LEADER_RETRY = 30  # seconds
+
+_held = {}  # name -> open lock file, kept open for the life of the process
+
+
+def try_lead(name):
+    """Takes the leader lock for `name` if it is free; True if this process holds it."""
+    if name in _held:
+        return True
+    lock_file = open(os.path.join(LEADER_LOCK_DIR, f"educonnect-{name}.lock"), "w")
+    if not lock(lock_file, blocking=False):
+        lock_file.close()
+        return False
+    _held[name] = lock_file
+    return True
+
+
+def is_leader(name):
+    return name in _held
+
+
+def run_as_leader(name, task, sleep=time.sleep, retry=LEADER_RETRY):
+    """Waits until this process leads `name`, then runs task(sleep=sleep); meant as a background task."""
+    while not try_lead(name):
+        sleep(retry)
+    task(sleep=sleep)
@@ -0,0 +1,61 @@
+from modules.rollup import refresh_monthly_rollup
+from modules.queries import cursor_execute, cursor_fetch_all, placeholders
+
+# Manual attendance requests.
+#
+# manual_attendance_requests is the pending queue: a row is deleted once a
+# teacher approves or ignores it. A student has at most one pending request
+# per day (unique on student_id, request_date), so repeated taps on "request
+# manual attendance" are absorbed by the INSERT IGNORE. Teachers resolve any
+# number of requests in one transaction with set-based statements.
+
+MANUAL_REQUEST_ACTIONS = ('approve', 'ignore')
+MAX_RESOLVE_BATCH = 500
+
+
+def create_manual_request(cursor, student_id):
+    """Queues a request for today; returns False if one is already pending."""
+    return cursor_execute(cursor, "manual_requests.create", (student_id,)) > 0
+
+
+def resolve_manual_requests(db, request_ids, action, roster=("", ())):
+    """
+    Approves or ignores pending requests in one transaction. Approving marks
+    each requesting student present once (students already present today are
+    left alone). Requests outside `roster` (from teacher_roster_filter on
+    r.student_id) or already resolved are skipped.
+    Returns (resolved request ids, their student ids, students marked present).
+    """
+    if action not in MANUAL_REQUEST_ACTIONS:
+        raise ValueError(f"Invalid action: {action}")
+    request_ids = sorted({int(rid) for rid in request_ids})
+    if not request_ids:
+        return [], [], 0
+
+    roster_sql, roster_params = roster
+    cursor = db.cursor(buffered=True)
+    try:
+        rows = cursor_fetch_all(
+            cursor, "manual_requests.lock", (*request_ids, *roster_params),
+            ids=placeholders(request_ids), roster=roster_sql
+        )
+        if not rows:
+            db.rollback()
+            return [], [], 0
+        resolved = [row[0] for row in rows]
+        student_ids = sorted({row[1] for row in rows})
+
+        marked = 0
+        if action == 'approve':
+            marked = cursor_execute(cursor, "manual_requests.approve", student_ids, ids=placeholders(student_ids))
+            if marked:
+                refresh_monthly_rollup(cursor, student_ids)
+
+        cursor_execute(cursor, "manual_requests.delete", resolved, ids=placeholders(resolved))
+        db.commit()
+        return resolved, student_ids, marked
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,442 @@
+import os
+import re
+import json
+import time
+import bisect
+import datetime
+import threading
+from modules.database import DB_BACKEND
+
+# Named SQL statements for the request handlers and the helper modules.
+#
+# Handlers call fetch_all / fetch_one / execute_write with a statement name instead
+# of inlining SQL. Helpers that run inside a caller's transaction (rosters,
+# rollups, the spool, bulk marking, manual requests) use cursor_fetch_all /
+# cursor_execute on the cursor they were given, so their SQL is timed too. On pooled connections (DB_POOL_SIZE in modules/database.py)
+# statements run on server-side prepared cursors cached on the physical
+# connection, so each is prepared once and then only sends parameters. A
+# one-off connection would pay an extra round trip to prepare a statement it
+# runs once or twice, so it uses plain cursors. Rows are tuples unless
+# dict_rows=True is asked for.
+#
+# Statements may contain {fragment} slots (roster filters, keyset conditions)
+# filled in per call; every variant is timed under the statement's name.
+# query_stats() reports per-statement call counts, total time and a latency
+# histogram for this process. Executions slower than QUERY_SLOW_MS are
+# appended to SLOW_QUERY_LOG as JSON lines, with the EXPLAIN plan of SELECTs
+# (at most one EXPLAIN per statement per SLOW_EXPLAIN_INTERVAL).
+
+QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_EXPLAIN_INTERVAL = 60  # seconds
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+MAX_CACHED_CURSORS = 64  # per connection
+
+_TODAY = "a.marked_at >= CURDATE() AND a.marked_at < CURDATE() + INTERVAL 1 DAY"
+_TODAY_UNALIASED = "marked_at >= CURDATE() AND marked_at < CURDATE() + INTERVAL 1 DAY"
+
+STATEMENTS = {
+    "teacher.insert": """
+        INSERT INTO teachers (first_name, last_name, email, password, school_name)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    "teacher.login": "SELECT id, first_name, password FROM teachers WHERE email = %s",
+    "teacher.set_location": "UPDATE teachers SET latitude = %s, longitude = %s WHERE id = %s",
+    "student.insert": """
+        INSERT INTO students (first_name, last_name, email, password, student_id, face_data, face_encoding)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """,
+    "student.login": "SELECT id, first_name, last_name, student_id, password FROM students WHERE email = %s",
+    "student.identity": "SELECT student_id, first_name, last_name FROM students WHERE id = %s",
+    "student.by_enrollment_no": "SELECT id, first_name, last_name FROM students WHERE student_id = %s",
+    "student.details_today": f"""
+        SELECT s.first_name, s.last_name, s.student_id AS enrollment_no, a.status
+        FROM students s
+        LEFT JOIN attendance a ON s.id = a.student_id AND {_TODAY}
+        WHERE s.id = %s
+        ORDER BY a.marked_at DESC
+        LIMIT 1
+    """,
+    "attendance.insert_present": """
+        INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
+        VALUES (%s, %s, %s, 'Present', %s)
+    """,
+    "attendance.exists_between": """
+        SELECT id FROM attendance
+        WHERE student_id = %s AND marked_at >= %s AND marked_at < %s
+        LIMIT 1
+    """,
+    "students.identities": "SELECT id, student_id, first_name, last_name FROM students WHERE id IN ({ids})",
+    "roster.total": "SELECT COUNT(*) FROM students s WHERE 1=1 {roster}",
+    "roster.student_ids": "SELECT s.id FROM students s WHERE 1=1 {roster}",
+    "roster.present_today": f"""
+        SELECT COUNT(DISTINCT a.student_id)
+        FROM attendance a
+        WHERE {_TODAY}
+        AND a.status = 'Present'
+        {{roster}}
+    """,
+    "roster.recent_today": f"""
+        SELECT CONCAT(s.first_name, ' ', s.last_name) as name, s.student_id as enrollment_no,
+        a.status, a.marked_at as timestamp
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        WHERE {_TODAY}
+        {{roster}}
+        ORDER BY a.marked_at DESC
+        LIMIT 5
+    """,
+    "roster.present_page": f"""
+        SELECT s.id, s.first_name, s.last_name, s.student_id AS enrollment_no, MAX(a.marked_at) as marked_at
+        FROM attendance a
+        JOIN students s ON s.id = a.student_id
+        WHERE {_TODAY}
+        AND a.status = 'Present'
+        {{filters}}
+        GROUP BY s.id, s.first_name, s.last_name, s.student_id
+        {{having}}
+        ORDER BY marked_at DESC, s.id DESC
+        LIMIT %s
+    """,
+    "roster.absent_page": f"""
+        SELECT s.id, s.first_name, s.last_name, s.student_id AS enrollment_no, NULL as marked_at
+        FROM students s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM attendance a
+            WHERE a.student_id = s.id
+            AND {_TODAY}
+            AND a.status = 'Present'
+        )
+        {{filters}}
+        {{after}}
+        ORDER BY s.id
+        LIMIT %s
+    """,
+    "manual_requests.pending": """
+        SELECT r.id, s.id as student_id, s.first_name, s.last_name, s.student_id AS enrollment_no
+        FROM manual_attendance_requests r
+        JOIN students s ON r.student_id = s.id
+        WHERE 1=1 {roster}
+        ORDER BY r.requested_at DESC
+    """,
+    "classes.insert": "INSERT INTO classes (teacher_id, name, section) VALUES (%s, %s, %s)",
+    "classes.for_teacher": """
+        SELECT c.id, c.name, c.section, COUNT(ce.student_id) AS student_count
+        FROM classes c
+        LEFT JOIN class_enrollments ce ON ce.class_id = c.id
+        WHERE c.teacher_id = %s
+        GROUP BY c.id, c.name, c.section
+        ORDER BY c.name, c.section
+    """,
+    "classes.owned": "SELECT id FROM classes WHERE id = %s AND teacher_id = %s",
+    "class_enrollments.add": """
+        INSERT IGNORE INTO class_enrollments (class_id, student_id)
+        SELECT %s, s.id FROM students s WHERE s.student_id IN ({enrollment_nos})
+    """,
+    "class_enrollments.remove": """
+        DELETE FROM class_enrollments
+        WHERE class_id = %s
+        AND student_id IN (SELECT id FROM students WHERE student_id IN ({enrollment_nos}))
+    """,
+    # modules/gallery.py and modules/templates.py; registration encoding first
+    "gallery.templates": """
+        SELECT id AS sid, face_encoding AS encoding, 0 AS source, 0 AS template_id FROM students
+        WHERE face_encoding IS NOT NULL {students}
+        UNION ALL
+        SELECT student_id AS sid, encoding, 1 AS source, id AS template_id FROM face_templates
+        WHERE 1=1 {templates}
+        ORDER BY sid, source, template_id
+    """,
+    "face_templates.lock_students": "SELECT id FROM students WHERE id IN ({ids}) FOR UPDATE",
+    "face_templates.counts": """
+        SELECT student_id, COUNT(*) FROM face_templates WHERE student_id IN ({ids}) GROUP BY student_id
+    """,
+    "face_templates.insert": "INSERT INTO face_templates (student_id, encoding) VALUES (%s, %s)",
+    "students.touch_face": "UPDATE students SET face_updated_at = NOW() WHERE id IN ({ids})",
+    "attendance.insert": """
+        INSERT INTO attendance (student_id, enrollment_no, name, status) VALUES (%s, %s, %s, %s)
+    """,
+    # modules/classes.py
+    "classes.teacher_has_classes": "SELECT EXISTS(SELECT 1 FROM classes WHERE teacher_id = %s) AS has_classes",
+    "classes.geofence_for_student": """
+        SELECT DISTINCT t.id, t.latitude, t.longitude
+        FROM class_enrollments ce
+        JOIN classes c ON c.id = ce.class_id
+        JOIN teachers t ON t.id = c.teacher_id
+        WHERE ce.student_id = %s AND t.latitude IS NOT NULL AND t.longitude IS NOT NULL
+    """,
+    "classes.geofence_all": """
+        SELECT id, latitude, longitude FROM teachers WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """,
+    "classes.students_per_teacher": """
+        SELECT c.teacher_id, COUNT(DISTINCT ce.student_id) AS students
+        FROM class_enrollments ce
+        JOIN classes c ON c.id = ce.class_id
+        WHERE ce.student_id IN ({ids})
+        GROUP BY c.teacher_id
+    """,
+    "classes.unscoped_teachers": "SELECT id FROM teachers WHERE id NOT IN (SELECT teacher_id FROM classes)",
+    # modules/rollup.py
+    "rollup.refresh": """
+        INSERT INTO attendance_monthly (student_id, year, month, present_days)
+        SELECT s.id, %s, %s, COUNT(DISTINCT DATE(a.marked_at))
+        FROM students s
+        LEFT JOIN attendance a ON a.student_id = s.id
+            AND a.status = 'Present'
+            AND a.marked_at >= %s AND a.marked_at < %s
+        WHERE 1=1 {students}
+        GROUP BY s.id
+        ON DUPLICATE KEY UPDATE present_days = VALUES(present_days)
+    """,
+    "rollup.month": """
+        SELECT present_days FROM attendance_monthly
+        WHERE student_id = %s AND year = %s AND month = %s
+    """,
+    "rollup.history": """
+        SELECT year, month, present_days FROM attendance_monthly
+        WHERE student_id = %s AND (year * 100 + month) >= %s
+    """,
+    # modules/spool.py
+    "spool.progress_for_update": "SELECT applied_seq FROM attendance_spool_progress WHERE spool_id = %s FOR UPDATE",
+    "spool.present_between": """
+        SELECT student_id, marked_at FROM attendance
+        WHERE student_id IN ({ids}) AND status = 'Present' AND marked_at >= %s AND marked_at < %s
+        FOR UPDATE
+    """,
+    "spool.insert_attendance": """
+        INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    "spool.progress_save": """
+        INSERT INTO attendance_spool_progress (spool_id, applied_seq) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE applied_seq = VALUES(applied_seq)
+    """,
+    "spool.progress_delete": "DELETE FROM attendance_spool_progress WHERE spool_id = %s",
+    # modules/bulk_marking.py
+    "bulk.roster_chunk": "SELECT s.id FROM students s WHERE s.id IN ({ids}) {roster}",
+    "bulk.roster_page": "SELECT s.id FROM students s WHERE s.id > %s {roster} ORDER BY s.id LIMIT %s",
+    "bulk.changed_today": f"""
+        SELECT student_id FROM attendance
+        WHERE student_id IN ({{ids}}) AND {_TODAY_UNALIASED}
+        GROUP BY student_id
+        HAVING (SUM(status = 'Present') > 0) <> %s
+        FOR UPDATE
+    """,
+    "bulk.set_status": f"""
+        UPDATE attendance SET status = %s, marked_at = NOW()
+        WHERE student_id IN ({{ids}}) AND {_TODAY_UNALIASED} AND status <> %s
+    """,
+    "bulk.insert_missing": f"""
+        INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
+        SELECT s.id, s.student_id, CONCAT(s.first_name, ' ', s.last_name), %s, NOW()
+        FROM students s
+        WHERE s.id IN ({{ids}})
+        AND NOT EXISTS (
+            SELECT 1 FROM attendance a
+            WHERE a.student_id = s.id AND {_TODAY}
+        )
+    """,
+    # modules/manual_requests.py
+    "manual_requests.create": """
+        INSERT IGNORE INTO manual_attendance_requests (student_id, request_date) VALUES (%s, CURDATE())
+    """,
+    "manual_requests.lock": """
+        SELECT r.id, r.student_id FROM manual_attendance_requests r
+        WHERE r.id IN ({ids}) {roster}
+        FOR UPDATE
+    """,
+    "manual_requests.approve": f"""
+        INSERT INTO attendance (student_id, enrollment_no, name, status, marked_at)
+        SELECT s.id, s.student_id, CONCAT(s.first_name, ' ', s.last_name), 'Present', NOW()
+        FROM students s
+        WHERE s.id IN ({{ids}})
+        AND NOT EXISTS (
+            SELECT 1 FROM attendance a
+            WHERE a.student_id = s.id AND a.status = 'Present'
+            AND {_TODAY}
+        )
+    """,
+    "manual_requests.delete": "DELETE FROM manual_attendance_requests WHERE id IN ({ids})",
+}
+
+_stats = {}  # name -> {"calls", "total_ms", "max_ms", "buckets"}
+_stats_lock = threading.Lock()
+_last_explain = {}  # name -> monotonic time of the last EXPLAIN
+_log_lock = threading.Lock()
+
+
+def _record(name, elapsed_ms):
+    with _stats_lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = {
+                "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            }
+        stat["calls"] += 1
+        stat["total_ms"] += elapsed_ms
+        stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+        stat["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS_MS, elapsed_ms)] += 1
+
+
+def _cursor_for(db, sql):
+    # Pooled connections wrap the physical connection that owns the statements
+    pooled = getattr(db, "_cnx", None)
+    cnx = pooled or db
+    # A reconnect (new server thread) loses every prepared statement
+    session = getattr(cnx, "connection_id", None)
+    cache = getattr(cnx, "_named_cursors", None)
+    if cache is None or cache[0] != session:
+        cache = (session, {})
+        cnx._named_cursors = cache
+    cursors = cache[1]
+    cursor = cursors.pop(sql, None)
+    if cursor is None:
+        if len(cursors) >= MAX_CACHED_CURSORS:
+            oldest = next(iter(cursors))
+            cursors.pop(oldest).close()
+        cursor = cnx.cursor(prepared=True) if pooled else cnx.cursor(buffered=True)
+    cursors[sql] = cursor  # most recently used last
+    return cursor
+
+
+def statement(name, **fragments):
+    """SQL text of a named statement with its {fragment} slots filled in."""
+    sql = STATEMENTS[name]
+    return sql.format(**fragments) if fragments else sql
+
+
+def placeholders(values):
+    """"%s, %s, ..." for an IN ({ids}) fragment of len(values) parameters."""
+    return ", ".join(["%s"] * len(values))
+
+
+def _connection_of(cursor):
+    # mysql.connector cursors keep their connection as _connection (pure Python)
+    # or _cnx (C extension); the SQLite shim's cursors as _connection
+    return getattr(cursor, "_connection", None) or getattr(cursor, "_cnx", None)
+
+
+def _explain(db, name, sql, params):
+    if db is None or not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    now = time.monotonic()
+    if now - _last_explain.get(name, -SLOW_EXPLAIN_INTERVAL) < SLOW_EXPLAIN_INTERVAL:
+        return None
+    _last_explain[name] = now
+    cursor = db.cursor()
+    try:
+        prefix = "EXPLAIN QUERY PLAN " if DB_BACKEND == "sqlite" else "EXPLAIN "
+        cursor.execute(prefix + sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, (str(v) if v is not None else None for v in row))) for row in cursor.fetchall()]
+    except Exception as e:
+        return [{"error": str(e)}]
+    finally:
+        cursor.close()
+
+
+def _log_slow(db, name, sql, params, elapsed_ms):
+    entry = {
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "statement": name,
+        "ms": round(elapsed_ms, 1),
+        "sql": re.sub(r"\s+", " ", sql).strip(),
+        "plan": _explain(db, name, sql, params),
+    }
+    try:
+        with _log_lock, open(SLOW_QUERY_LOG, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"Could not write slow query log: {e}")
+
+
+def _timed(db, name, sql, params, cursor, fetch, many=False):
+    start = time.perf_counter()
+    if many:
+        cursor.executemany(sql, params)
+    else:
+        cursor.execute(sql, params)
+    rows = cursor.fetchall() if fetch else None
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    _record(name, elapsed_ms)
+    if elapsed_ms >= QUERY_SLOW_MS:
+        _log_slow(db, name, sql, None if many else params, elapsed_ms)
+    return rows
+
+
+def _run(db, name, params, fragments, fetch):
+    sql = statement(name, **fragments)
+    cursor = _cursor_for(db, sql)
+    rows = _timed(db, name, sql, tuple(params), cursor, fetch)
+    return cursor, rows
+
+
+def fetch_all(db, name, params=(), dict_rows=False, **fragments):
+    """All rows of a named SELECT on `db`, as tuples (or dicts with dict_rows=True)."""
+    cursor, rows = _run(db, name, params, fragments, fetch=True)
+    if dict_rows:
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+    return rows
+
+
+def fetch_one(db, name, params=(), dict_rows=False, **fragments):
+    """First row of a named SELECT, or None."""
+    rows = fetch_all(db, name, params, dict_rows=dict_rows, **fragments)
+    return rows[0] if rows else None
+
+
+def fetch_value(db, name, params=(), **fragments):
+    """First column of the first row (e.g. a COUNT), or None."""
+    row = fetch_one(db, name, params, **fragments)
+    return row[0] if row else None
+
+
+def execute_write(db, name, params=(), **fragments):
+    """Runs a named write; returns (rowcount, lastrowid). Commit is up to the caller."""
+    cursor, _ = _run(db, name, params, fragments, fetch=False)
+    return cursor.rowcount, cursor.lastrowid
+
+
+def cursor_fetch_all(cursor, name, params=(), **fragments):
+    """
+    All rows of a named SELECT run on the caller's cursor, for helpers inside
+    the caller's transaction. Rows are whatever the cursor returns.
+    """
+    sql = statement(name, **fragments)
+    return _timed(_connection_of(cursor), name, sql, tuple(params), cursor, fetch=True)
+
+
+def cursor_fetch_one(cursor, name, params=(), **fragments):
+    """First row of cursor_fetch_all, or None."""
+    rows = cursor_fetch_all(cursor, name, params, **fragments)
+    return rows[0] if rows else None
+
+
+def cursor_execute(cursor, name, params=(), many=False, **fragments):
+    """
+    Runs a named write on the caller's cursor (executemany over `params`
+    with many=True); returns the rowcount. Commit is up to the caller.
+    """
+    sql = statement(name, **fragments)
+    params = [tuple(p) for p in params] if many else tuple(params)
+    _timed(_connection_of(cursor), name, sql, params, cursor, fetch=False, many=many)
+    return cursor.rowcount
+
+
+def query_stats():
+    """Per-statement timings for this process, most total time first."""
+    with _stats_lock:
+        stats = {name: dict(stat, buckets=list(stat["buckets"])) for name, stat in _stats.items()}
+    labels = [f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    report = []
+    for name, stat in sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        report.append({
+            "statement": name,
+            "calls": stat["calls"],
+            "total_ms": round(stat["total_ms"], 1),
+            "avg_ms": round(stat["total_ms"] / stat["calls"], 2),
+            "max_ms": round(stat["max_ms"], 1),
+            "histogram": dict(zip(labels, stat["buckets"])),
+        })
+    return {"slow_ms": QUERY_SLOW_MS, "statements": report}
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from modules.classes import count_students_per_teacher
+from modules.versions import bump_for_students
+
+# Real-time dashboard events.
+#
+# Routes do not call socketio.emit() directly. They queue events here and
+# flush_loop() emits them once per EMIT_TICK, one message per room and event:
+# alerts are batched into a list (identical messages collapsed) and
+# attendance deltas are merged into a single running count. A burst of
+# verifications then costs each dashboard one refresh per tick instead of one
+# per student.
+#
+# With SOCKETIO_MESSAGE_QUEUE set (e.g. redis://localhost:6379/0) every worker
+# publishes its emits to the queue and delivers the ones for its own clients,
+# so the app can run several workers behind a load balancer. memory:// uses
+# kombu's in-process transport as a stand-in broker for tests and single
+# process runs.
+
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "educonnect")
+EMIT_TICK = float(os.getenv("SOCKETIO_EMIT_TICK", "0.5"))  # seconds
+
+# Teachers without classes see the whole school, so they also get every delta
+WHOLE_SCHOOL_ROOM = "whole-school"
+
+_pending_alerts = {}  # room -> [payload, ...]
+_pending_deltas = {}  # room -> merged attendance_delta payload
+_pending_lock = threading.Lock()
+
+
+def socketio_options():
+    """Keyword arguments for SocketIO() selecting the cross-process manager, if any."""
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return {}
+    return {"message_queue": SOCKETIO_MESSAGE_QUEUE, "channel": SOCKETIO_CHANNEL}
+
+
+def queue_alert(room, payload):
+    """Queues an alert for `room`; identical alerts within a tick are sent once."""
+    with _pending_lock:
+        alerts = _pending_alerts.setdefault(room, [])
+        if payload not in alerts:
+            alerts.append(payload)
+
+
+def queue_attendance_delta(rooms, status, affected):
+    """Queues a change of `affected` students to `status` today for each room."""
+    if not affected:
+        return
+    with _pending_lock:
+        for room in rooms:
+            delta = _pending_deltas.setdefault(room, {"affected": 0, "statuses": {}})
+            delta["affected"] += affected
+            delta["statuses"][status] = delta["statuses"].get(status, 0) + affected
+
+
+def notify_attendance(cursor, student_ids, status="Present"):
+    """
+    Bumps the dashboard versions of newly written attendance rows and queues a
+    delta for the students' class teachers and the whole-school room. Call it
+    after the rows are committed.
+    """
+    student_ids = set(student_ids)
+    bump_for_students(cursor, student_ids)
+    for teacher_id, count in count_students_per_teacher(cursor, student_ids).items():
+        queue_attendance_delta([teacher_id], status, count)
+    queue_attendance_delta([WHOLE_SCHOOL_ROOM], status, len(student_ids))
+
+
+def flush(emit):
+    """Emits everything queued since the last flush; returns the number of messages."""
+    with _pending_lock:
+        alerts = dict(_pending_alerts)
+        deltas = dict(_pending_deltas)
+        _pending_alerts.clear()
+        _pending_deltas.clear()
+
+    today = time.strftime("%Y-%m-%d")
+    for room, payloads in alerts.items():
+        emit("attendance_alerts", {"alerts": payloads}, room=room)
+    for room, delta in deltas.items():
+        emit("attendance_delta", dict(delta, date=today), room=room)
+    return len(alerts) + len(deltas)
+
+
+def flush_loop(socketio, tick=EMIT_TICK):
+    """Flushes queued events every `tick` seconds; meant to run as a background task."""
+    while True:
+        socketio.sleep(tick)
+        try:
+            flush(socketio.emit)
+        except Exception as e:
+            print(f"Realtime flush error: {e}")
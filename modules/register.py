@@ -4,6 +4,9 @@ import numpy as np
 import io
 import pickle
 from modules.database import get_db_connection
+from modules.gallery import set_student_templates
+from modules.embedding_cache import encode_image_bytes
+from modules.detectors import detect_faces
 
 def get_face_encoding(image_input):
     """
@@ -17,15 +20,18 @@ def get_face_encoding(image_input):
         # Assume it's a FileStorage or has read() method
         try:
             file_bytes = image_input.read()
-            nparr = np.frombuffer(file_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             # Reset file pointer for future reads
             if hasattr(image_input, 'seek'):
                 image_input.seek(0)
         except Exception as e:
             print(f"Error reading image: {e}")
             return None
-    
+        # Shared with verify/sync, so a photo seen there is not encoded again
+        encoding = encode_image_bytes(file_bytes, path="register")
+        if encoding is None:
+            print("Failed to decode image or no face found")
+        return encoding
+
     if img is None:
         print("Failed to decode image")
         return None
@@ -34,7 +40,7 @@ def get_face_encoding(image_input):
     rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     # Detect and encode
-    face_locations = face_recognition.face_locations(rgb_img)
+    face_locations = detect_faces(rgb_img, "register")
     encodings = face_recognition.face_encodings(rgb_img, face_locations)
 
     if len(encodings) > 0:
@@ -56,7 +62,7 @@ def register_student_face(student_id, photo_blob):
     rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     # Detect face & encode
-    face_locations = face_recognition.face_locations(rgb_img)
+    face_locations = detect_faces(rgb_img, "register")
     if len(face_locations) == 0:
         print("⚠️ No face detected in uploaded photo.")
         return False
@@ -70,10 +76,13 @@ def register_student_face(student_id, photo_blob):
         # Save encoding in DB
         db = get_db_connection()
         cursor = db.cursor()
-        cursor.execute("UPDATE students SET face_encoding=%s WHERE id=%s", (encoding_blob, student_id))
+        cursor.execute("UPDATE students SET face_encoding=%s, face_updated_at=NOW() WHERE id=%s", (encoding_blob, student_id))
+        # Templates learned from the old face no longer apply
+        cursor.execute("DELETE FROM face_templates WHERE student_id=%s", (student_id,))
         db.commit()
         cursor.close()
         db.close()
+        set_student_templates(student_id, [encoding])
 
         print("✅ Face registered successfully")
         return True
@@ -0,0 +1,129 @@
+import datetime
+import threading
+import time
+from modules.queries import cursor_execute, cursor_fetch_all, cursor_fetch_one, placeholders
+
+# Per-student, per-month attendance rollup.
+#
+# `attendance_monthly` holds one row per (student, year, month) with the number
+# of distinct days the student was marked Present. Every attendance write calls
+# refresh_monthly_rollup() inside the same transaction, so the student dashboard
+# reads its stats with a single primary-key lookup instead of re-aggregating the
+# attendance table on every poll.
+
+STATS_CACHE_TTL = 15  # seconds
+
+_stats_cache = {}
+_stats_cache_lock = threading.Lock()
+
+
+def month_bounds(year, month):
+    """Returns (first_day, first_day_of_next_month) for the given month."""
+    first_day = datetime.date(year, month, 1)
+    if month == 12:
+        next_month = datetime.date(year + 1, 1, 1)
+    else:
+        next_month = datetime.date(year, month + 1, 1)
+    return first_day, next_month
+
+
+def refresh_monthly_rollup(cursor, student_ids=None, day=None):
+    """
+    Recomputes the rollup row for the month containing `day` (default today).
+    student_ids: iterable of students.id to refresh, or None for every student
+    (used by the bulk marking routes). Must run on the cursor of the write
+    transaction so the rollup commits together with the attendance rows.
+    """
+    day = day or datetime.date.today()
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    first_day, next_month = month_bounds(day.year, day.month)
+
+    params = [day.year, day.month, first_day, next_month]
+    where = ""
+    if student_ids is not None:
+        student_ids = list(student_ids)
+        if not student_ids:
+            return
+        where = f"AND s.id IN ({placeholders(student_ids)})"
+        params.extend(student_ids)
+
+    cursor_execute(cursor, "rollup.refresh", params, students=where)
+
+    invalidate_student_stats(student_ids)
+
+
+def get_month_present_days(cursor, student_id, year, month):
+    """Reads present days for one student and month from the rollup."""
+    row = cursor_fetch_one(cursor, "rollup.month", (student_id, year, month))
+    if not row:
+        return 0
+    return int(row['present_days'] if isinstance(row, dict) else row[0])
+
+
+def get_monthly_history(cursor, student_id, months):
+    """
+    Returns the last `months` months (oldest first, current month included) as
+    dicts with year, month, present_days, total_days and percentage.
+    """
+    today = datetime.date.today()
+    keys = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        keys.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    keys.reverse()
+
+    oldest_year, oldest_month = keys[0]
+    rows = cursor_fetch_all(cursor, "rollup.history", (student_id, oldest_year * 100 + oldest_month))
+    found = {}
+    for row in rows:
+        if isinstance(row, dict):
+            found[(int(row['year']), int(row['month']))] = int(row['present_days'])
+        else:
+            found[(int(row[0]), int(row[1]))] = int(row[2])
+
+    history = []
+    for year, month in keys:
+        first_day, next_month = month_bounds(year, month)
+        total_days = (next_month - first_day).days
+        present_days = found.get((year, month), 0)
+        history.append({
+            'year': year,
+            'month': month,
+            'present_days': present_days,
+            'total_days': total_days,
+            'percentage': round(present_days / total_days * 100) if total_days > 0 else 0
+        })
+    return history
+
+
+def get_cached_student_stats(key):
+    """Returns a cached stats payload for `key` or None if missing/expired."""
+    with _stats_cache_lock:
+        entry = _stats_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            del _stats_cache[key]
+            return None
+        return payload
+
+
+def set_cached_student_stats(key, payload):
+    with _stats_cache_lock:
+        _stats_cache[key] = (time.monotonic() + STATS_CACHE_TTL, payload)
+
+
+def invalidate_student_stats(student_ids=None):
+    """Drops cached stats for the given students (or everyone)."""
+    with _stats_cache_lock:
+        if student_ids is None:
+            _stats_cache.clear()
+            return
+        wanted = {int(sid) for sid in student_ids}
+        for key in [k for k in _stats_cache if k[0] in wanted]:
+            del _stats_cache[key]
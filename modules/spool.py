@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import socket
+import datetime
+import threading
+import collections
+from modules.database import get_db_connection
+from modules.rollup import refresh_monthly_rollup
+from modules.realtime import notify_attendance
+from modules.filelock import lock
+from modules.queries import cursor_execute, cursor_fetch_all, cursor_fetch_one, placeholders
+
+# Write-behind spool for recognised check-ins.
+#
+# With ATTENDANCE_SPOOL=1, verify_face, mark_attendance and the camera loop
+# append each attendance row to a per-process log file under SPOOL_DIR and
+# acknowledge it once the line is fsync'd; concurrent writers share one fsync
+# (group commit). spool_flush_loop() batch-inserts the log into `attendance`
+# with executemany and records the last applied sequence number in
+# attendance_spool_progress in the same transaction, so a crash between the
+# insert and the bookkeeping never applies a row twice. A Present record is
+# dropped if the student already has a Present row that day (an offline
+# capture synced while the verify-face copy was still spooled, or a retried
+# check-in), so the flush is idempotent per student and day. Dashboards are
+# notified (ETag bump and realtime delta) by the flusher once the rows are
+# committed, not when a check-in is spooled. Log files left by
+# processes that died (no longer flock'd) are replayed on the next start.
+
+ATTENDANCE_SPOOL = os.getenv("ATTENDANCE_SPOOL", "0") == "1"
+SPOOL_DIR = os.getenv("ATTENDANCE_SPOOL_DIR", "attendance_spool")
+SPOOL_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_SPOOL_FLUSH_INTERVAL", "0.5"))  # seconds
+SPOOL_BATCH_SIZE = 500
+SPOOL_ROTATE_BYTES = 1024 * 1024
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def _read_records(path, offset, limit):
+    """Complete records from byte `offset` on; returns (records, new_offset)."""
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn tail of a crashed append
+            offset += len(line)
+            records.append(json.loads(line))
+            if len(records) >= limit:
+                break
+    return records, offset
+
+
+def _present_days(cursor, records):
+    """(student id, date) pairs that already have a Present row, locked until commit."""
+    student_ids = sorted({r["student_id"] for r in records})
+    days = [datetime.datetime.fromisoformat(r["marked_at"]).date() for r in records]
+    rows = cursor_fetch_all(
+        cursor, "spool.present_between",
+        (*student_ids, min(days), max(days) + datetime.timedelta(days=1)), ids=placeholders(student_ids)
+    )
+    return {(row[0], row[1].date()) for row in rows}
+
+
+def apply_records(db, spool_id, records):
+    """Inserts records not yet applied for `spool_id`; returns how many were inserted."""
+    cursor = db.cursor()
+    try:
+        try:
+            row = cursor_fetch_one(cursor, "spool.progress_for_update", (spool_id,))
+            applied_seq = row[0] if row else 0
+            fresh = [r for r in records if r["seq"] > applied_seq]
+            present = [r for r in fresh if r["status"] == "Present"]
+            present_days = _present_days(cursor, present) if present else set()
+            inserted = []
+            rows = []
+            months = {}  # (year, month) -> set of student ids for the rollup refresh
+            for r in fresh:
+                marked_at = datetime.datetime.fromisoformat(r["marked_at"])
+                if r["status"] == "Present":
+                    day = (r["student_id"], marked_at.date())
+                    if day in present_days:
+                        continue
+                    present_days.add(day)
+                inserted.append(r)
+                rows.append((r["student_id"], r["enrollment_no"], r["name"], r["status"], marked_at))
+                months.setdefault((marked_at.year, marked_at.month), set()).add(r["student_id"])
+            if rows:
+                cursor_execute(cursor, "spool.insert_attendance", rows, many=True)
+                for (year, month), student_ids in months.items():
+                    refresh_monthly_rollup(cursor, student_ids, datetime.date(year, month, 1))
+            cursor_execute(cursor, "spool.progress_save", (spool_id, max(applied_seq, records[-1]["seq"])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if inserted:
+            # Only now are the rows visible, so only now may dashboards hear of them
+            statuses = {}  # status -> set of student ids
+            for r in inserted:
+                statuses.setdefault(r["status"], set()).add(r["student_id"])
+            try:
+                for status, student_ids in statuses.items():
+                    notify_attendance(cursor, student_ids, status)
+            except Exception as e:
+                print(f"Error notifying attendance: {e}")
+        return len(inserted)
+    finally:
+        cursor.close()
+
+
+class Spool:
+    """This process's append-only attendance log."""
+
+    def __init__(self, directory=SPOOL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.spool_id = f"{socket.gethostname()}-{self.pid}-{int(time.time())}"
+        self.path = os.path.join(directory, f"{self.spool_id}.log")
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Held for the life of the process; replay_orphans() skips locked files
+        lock(self._fd)
+
+        self._write_lock = threading.Lock()
+        self._sync_cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._syncing = False
+        self._read_offset = 0
+        self._unapplied = collections.deque()  # (seq, spooled_at) not yet in the DB
+
+        self.applied_seq = 0
+        self.appended_total = 0
+        self.applied_total = 0
+        self.fsyncs = 0
+        self.last_flush_at = None
+        self.last_error = None
+
+    def append(self, record):
+        """Durably records one attendance row; returns once it is fsync'd."""
+        with self._write_lock:
+            seq = self._written_seq + 1
+            spooled_at = time.time()
+            line = json.dumps(dict(record, seq=seq, spooled_at=spooled_at), default=str) + "\n"
+            os.write(self._fd, line.encode())
+            self._written_seq = seq
+            self._unapplied.append((seq, spooled_at))
+            self.appended_total += 1
+        self._sync(seq)
+        return seq
+
+    def _sync(self, seq):
+        # Group commit: one writer fsyncs everything written so far while the
+        # others wait for it, instead of one fsync per check-in
+        with self._sync_cond:
+            while self._synced_seq < seq:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written_seq
+                self._sync_cond.release()
+                try:
+                    os.fsync(self._fd)
+                finally:
+                    self._sync_cond.acquire()
+                    self._syncing = False
+                    self._sync_cond.notify_all()
+                self._synced_seq = max(self._synced_seq, target)
+                self.fsyncs += 1
+
+    def flush(self, limit=SPOOL_BATCH_SIZE):
+        """Applies up to `limit` spooled records to the DB; returns how many were read."""
+        with self._flush_lock:
+            records, offset = _read_records(self.path, self._read_offset, limit)
+            if records:
+                db = get_db_connection()
+                try:
+                    self.applied_total += apply_records(db, self.spool_id, records)
+                finally:
+                    db.close()
+                self._read_offset = offset
+                with self._write_lock:
+                    self.applied_seq = records[-1]["seq"]
+                    while self._unapplied and self._unapplied[0][0] <= self.applied_seq:
+                        self._unapplied.popleft()
+            self.last_flush_at = time.time()
+            self._maybe_rotate()
+            return len(records)
+
+    def _maybe_rotate(self):
+        """Truncates the log once everything in it has been applied."""
+        with self._write_lock:
+            if self._read_offset >= SPOOL_ROTATE_BYTES and self.applied_seq == self._written_seq:
+                os.ftruncate(self._fd, 0)
+                self._read_offset = 0
+
+    def stats(self):
+        with self._write_lock:
+            oldest = self._unapplied[0][1] if self._unapplied else None
+            pending = self._written_seq - self.applied_seq
+        return {
+            "spool_id": self.spool_id,
+            "pending": pending,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "appended_total": self.appended_total,
+            "applied_total": self.applied_total,
+            "fsyncs": self.fsyncs,
+            "records_per_fsync": round(self.appended_total / self.fsyncs, 2) if self.fsyncs else None,
+            "last_flush_at": self.last_flush_at,
+            "last_error": self.last_error,
+        }
+
+
+def get_spool():
+    """This process's spool, created on first use (and again after a fork)."""
+    global _spool
+    with _spool_lock:
+        if _spool is None or _spool.pid != os.getpid():
+            _spool = Spool()
+        return _spool
+
+
+def spool_attendance(student_id, enrollment_no, name, status, marked_at):
+    """Appends one attendance row to the spool; it reaches the DB on the next flush."""
+    return get_spool().append({
+        "student_id": student_id,
+        "enrollment_no": enrollment_no,
+        "name": name,
+        "status": status,
+        "marked_at": marked_at.isoformat(" "),
+    })
+
+
+def replay_orphans(directory=SPOOL_DIR):
+    """Applies and removes log files left behind by processes that are gone."""
+    if not os.path.isdir(directory):
+        return 0
+    own = _spool.path if _spool is not None and _spool.pid == os.getpid() else None
+    replayed = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".log") or path == own:
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue  # replayed by another process starting at the same time
+        try:
+            if not lock(fd, blocking=False):
+                continue  # owner still running
+            if os.fstat(fd).st_nlink == 0:
+                continue  # replayed and removed after we opened it
+            spool_id = name[:-len(".log")]
+            offset = 0
+            db = get_db_connection()
+            try:
+                while True:
+                    records, offset = _read_records(path, offset, SPOOL_BATCH_SIZE)
+                    if not records:
+                        break
+                    replayed += apply_records(db, spool_id, records)
+                # The log goes first: a crash before the progress row is
+                # dropped leaves a stale row, never a log replayed from seq 0
+                os.remove(path)
+                cursor = db.cursor()
+                try:
+                    cursor_execute(cursor, "spool.progress_delete", (spool_id,))
+                    db.commit()
+                finally:
+                    cursor.close()
+            finally:
+                db.close()
+        finally:
+            os.close(fd)
+    if replayed:
+        print(f"Replayed {replayed} spooled attendance rows")
+    return replayed
+
+
+def spool_flush_loop(sleep=time.sleep, interval=SPOOL_FLUSH_INTERVAL):
+    """Replays orphaned spools, then keeps flushing this process's spool; meant to run as a background task."""
+    replayed = False
+    while True:
+        try:
+            if not replayed:
+                replay_orphans()
+                replayed = True
+            spool = get_spool()
+            try:
+                while spool.flush() >= SPOOL_BATCH_SIZE:
+                    pass
+                spool.last_error = None
+            except Exception as e:
+                spool.last_error = str(e)
+                raise
+        except Exception as e:
+            print(f"Attendance spool flush error: {e}")
+        sleep(interval)
+
+
+def spool_stats():
+    """Lag metrics for this process's spool."""
+    if not ATTENDANCE_SPOOL:
+        return {"enabled": False}
+    stats = get_spool().stats()
+    stats["enabled"] = ATTENDANCE_SPOOL
+    return stats
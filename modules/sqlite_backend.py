@@ -0,0 +1,269 @@
+import datetime
+import functools
+import re
+import sqlite3
+
+# Embedded SQLite backend (DB_BACKEND=sqlite) for kiosks, tests and benchmarks.
+#
+# connect() returns an object that behaves like the mysql.connector
+# connections used throughout the app: cursor(dictionary=..., buffered=...),
+# %s parameters, commit/rollback/close. MySQL functions the app relies on
+# (CURDATE, NOW, CONCAT, YEAR, MONTH) are registered as SQLite functions and
+# the few MySQL-only syntax forms are rewritten by translate().
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+)
+
+_REWRITES = [
+    (re.compile(r"CURDATE\(\)\s*\+\s*INTERVAL\s+(\d+)\s+DAY", re.I), r"DATE(CURDATE(), '+\1 day')"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.I), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.I), r"excluded.\1"),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.I), ""),
+    (re.compile(r"%s"), "?"),
+]
+
+# Store datetimes as ISO text that sorts and compares like MySQL TIMESTAMPs
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+
+# Timestamps come back as text from expressions such as MAX(marked_at)
+_TIMESTAMP_COLUMN = re.compile(r"(_at|^timestamp)$")
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql):
+    """Rewrites MySQL-only syntax used by the app into SQLite syntax."""
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _curdate():
+    return datetime.date.today().isoformat()
+
+
+def _date_part(index):
+    def extract(value):
+        if value is None:
+            return None
+        return int(str(value)[:10].split("-")[index])
+    return extract
+
+
+def _concat(*values):
+    if any(v is None for v in values):
+        return None
+    return "".join(str(v) for v in values)
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over a sqlite3 cursor."""
+
+    def __init__(self, connection, dictionary=False, owner=None):
+        self._cursor = connection.cursor()
+        self._dictionary = dictionary
+        self._connection = owner  # the SQLiteConnection, like mysql.connector cursors
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate(sql), tuple(params or ()))
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate(sql), [tuple(p) for p in seq_of_params])
+
+    def _convert(self, row):
+        if row is None:
+            return None
+        names = [column[0] for column in self._cursor.description]
+        values = [
+            _parse_timestamp(value) if isinstance(value, str) and _TIMESTAMP_COLUMN.search(name) else value
+            for name, value in zip(names, row)
+        ]
+        return dict(zip(names, values)) if self._dictionary else tuple(values)
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """mysql.connector-style connection wrapper."""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS:
+            self._connection.execute(pragma)
+        self._connection.create_function("NOW", 0, _now)
+        self._connection.create_function("CURDATE", 0, _curdate)
+        self._connection.create_function("YEAR", 1, _date_part(0), deterministic=True)
+        self._connection.create_function("MONTH", 1, _date_part(1), deterministic=True)
+        self._connection.create_function("CONCAT", -1, _concat, deterministic=True)
+
+    def cursor(self, dictionary=False, buffered=False, **kwargs):
+        # Every sqlite3 cursor is effectively buffered
+        return SQLiteCursor(self._connection, dictionary=dictionary, owner=self)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+def connect(path):
+    return SQLiteConnection(path)
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        school_name TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        student_id TEXT UNIQUE NOT NULL,
+        face_data BLOB,
+        face_encoding BLOB,
+        face_updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL REFERENCES students(id),
+        enrollment_no TEXT,
+        name TEXT,
+        status TEXT,
+        marked_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_attendance_student_marked ON attendance (student_id, marked_at)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_marked_status ON attendance (marked_at, status)",
+    "CREATE INDEX IF NOT EXISTS idx_students_first_name ON students (first_name)",
+    "CREATE INDEX IF NOT EXISTS idx_students_last_name ON students (last_name)",
+    "CREATE INDEX IF NOT EXISTS idx_students_face_updated ON students (face_updated_at)",
+    """
+    CREATE TABLE IF NOT EXISTS attendance_monthly (
+        student_id INTEGER NOT NULL REFERENCES students(id),
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        present_days INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (student_id, year, month)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_id INTEGER NOT NULL REFERENCES teachers(id),
+        name TEXT NOT NULL,
+        section TEXT NOT NULL DEFAULT '',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (teacher_id, name, section)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS class_enrollments (
+        class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+        student_id INTEGER NOT NULL REFERENCES students(id),
+        enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (class_id, student_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_class_enrollments_student ON class_enrollments (student_id)",
+    """
+    CREATE TABLE IF NOT EXISTS face_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL REFERENCES students(id),
+        encoding BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_face_templates_student ON face_templates (student_id)",
+    """
+    CREATE TABLE IF NOT EXISTS attendance_spool_progress (
+        spool_id TEXT PRIMARY KEY,
+        applied_seq INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS manual_attendance_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL REFERENCES students(id),
+        request_date DATE,
+        requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_manual_requests_student_day
+    ON manual_attendance_requests (student_id, request_date)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_manual_requests_requested ON manual_attendance_requests (requested_at)",
+]
+
+
+def create_tables(connection):
+    """Creates the SQLite equivalent of modules.database.create_tables' MySQL schema."""
+    cursor = connection.cursor()
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    connection.commit()
+    cursor.close()
@@ -0,0 +1,136 @@
+import os
+import time
+import pickle
+import threading
+import numpy as np
+from modules.database import get_db_connection
+from modules.gallery import get_gallery, set_student_templates, set_templates, load_templates
+from modules.queries import cursor_execute, cursor_fetch_all, placeholders
+
+# Multiple face templates per student.
+#
+# The registration encoding stays in students.face_encoding. Extra templates
+# go in face_templates and are learned from verifications that matched with
+# high confidence but still differ noticeably from everything stored (a new
+# lighting or pose), so later check-ins under those conditions match. A
+# candidate must also be a confident match for the registration encoding
+# itself, so templates cannot drift away from it one learned step at a time.
+# A student stops learning at MAX_EXTRA_TEMPLATES; re-registering starts over.
+# Verification compares against all of a student's templates with a single
+# vectorised min-distance, so extra templates cost no extra detect/encode.
+#
+# Learning stays off the request path: verify_face only queues a candidate
+# (in-memory, at most one per student) and template_learn_loop() stores the
+# queue every TEMPLATE_LEARN_INTERVAL in one transaction and publishes it as
+# one gallery generation.
+
+MATCH_THRESHOLD = 0.45  # stricter than face_recognition's default (~0.6)
+MAX_EXTRA_TEMPLATES = int(os.getenv("MAX_EXTRA_TEMPLATES", "4"))
+AUTO_ENROLL_MAX_DISTANCE = 0.35  # only learn from confident matches
+TEMPLATE_MIN_SPREAD = 0.2  # ...that add something the stored templates lack
+TEMPLATE_LEARN_INTERVAL = float(os.getenv("TEMPLATE_LEARN_INTERVAL", "30"))  # seconds
+
+_candidates = {}  # students.id -> float32 encoding waiting for template_learn_loop()
+_candidates_lock = threading.Lock()
+
+
+def student_templates(student_id, cursor=None):
+    """
+    (k, 128) matrix of the student's templates from the shared gallery,
+    falling back to the DB (and publishing it) on a miss. The DB is read on
+    `cursor`, or on a connection of its own, only for a miss. None if the
+    student has no face data.
+    """
+    templates = get_gallery().templates_for(int(student_id))
+    if templates is not None:
+        return templates
+    if cursor is None:
+        db = get_db_connection()
+        own_cursor = db.cursor()
+        try:
+            templates, _ = load_templates(own_cursor, "AND {sid} = %s", (student_id,))
+        finally:
+            own_cursor.close()
+            db.close()
+    else:
+        templates, _ = load_templates(cursor, "AND {sid} = %s", (student_id,))
+    if not len(templates):
+        return None
+    set_student_templates(int(student_id), templates)
+    return templates
+
+
+def min_template_distance(templates, encoding):
+    """Distance from `encoding` to the closest of `templates`."""
+    return float(np.min(np.linalg.norm(templates - np.asarray(encoding, dtype=np.float32), axis=1)))
+
+
+def queue_template_candidate(student_id, templates, encoding, distance):
+    """
+    Queues `encoding` to be learned as an extra template if the match was
+    confident but not a near-duplicate. `templates` are the student's gallery
+    rows (registration encoding first) and `distance` the match distance.
+    No DB work; returns True if the encoding was queued.
+    """
+    if not TEMPLATE_MIN_SPREAD <= distance <= AUTO_ENROLL_MAX_DISTANCE:
+        return False
+    if len(templates) - 1 >= MAX_EXTRA_TEMPLATES:
+        return False
+    if min_template_distance(templates[:1], encoding) > AUTO_ENROLL_MAX_DISTANCE:
+        return False
+    with _candidates_lock:
+        _candidates.setdefault(int(student_id), np.array(encoding, dtype=np.float32))
+    return True
+
+
+def learn_queued_templates():
+    """
+    Stores the queued candidates of students still under MAX_EXTRA_TEMPLATES
+    in one transaction and publishes their new rows as a single gallery
+    generation. Returns how many templates were added.
+    """
+    with _candidates_lock:
+        candidates = dict(_candidates)
+        _candidates.clear()
+    if not candidates:
+        return 0
+
+    student_ids = sorted(candidates)
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        try:
+            # Row locks serialise learners in other workers, so the cap holds
+            cursor_fetch_all(cursor, "face_templates.lock_students", student_ids, ids=placeholders(student_ids))
+            counts = dict(
+                cursor_fetch_all(cursor, "face_templates.counts", student_ids, ids=placeholders(student_ids))
+            )
+            learned = [sid for sid in student_ids if counts.get(sid, 0) < MAX_EXTRA_TEMPLATES]
+            if learned:
+                cursor_execute(cursor, "face_templates.insert", [
+                    (sid, pickle.dumps(np.array(candidates[sid], dtype=np.float64))) for sid in learned
+                ], many=True)
+                # Lets the gallery snapshot catch-up pick the new templates up
+                cursor_execute(cursor, "students.touch_face", learned, ids=placeholders(learned))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if not learned:
+            return 0
+        encodings, ids = load_templates(cursor, f"AND {{sid}} IN ({placeholders(learned)})", learned)
+    finally:
+        cursor.close()
+        db.close()
+    set_templates(learned, encodings, ids)
+    return len(learned)
+
+
+def template_learn_loop(sleep=time.sleep, interval=TEMPLATE_LEARN_INTERVAL):
+    """Learns queued templates every `interval` seconds; meant to run as a background task."""
+    while True:
+        sleep(interval)
+        try:
+            learn_queued_templates()
+        except Exception as e:
+            print(f"Error adding face templates: {e}")
@@ -0,0 +1,109 @@
+import os
+import uuid
+import datetime
+import tempfile
+from modules.classes import count_students_per_teacher, unscoped_teacher_ids
+from modules.filelock import lock
+
+# Per-day attendance version counters behind the dashboard ETags.
+#
+# Every attendance write bumps the counters of the scopes it affects:
+# "student-<id>" for the students themselves and "teacher-<id>" for their class
+# teachers plus every teacher without classes (who sees the whole school).
+# Rare school-wide changes (bulk marking, new students) bump "bulk", which is
+# part of every ETag. Polling endpoints build their ETag from these counters
+# alone, so an unchanged poll is answered with 304 without touching the DB.
+#
+# Counters are tiny files in VERSION_DIR (default /dev/shm) shared by all
+# workers and the camera processes on the host. The directory gets a random
+# epoch when created, so ETags issued before a reboot never match again.
+
+VERSION_DIR = os.getenv("VERSION_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "educonnect-versions"
+)
+BULK_SCOPE = "bulk"
+
+_epoch = None
+
+
+def _get_epoch():
+    global _epoch
+    if _epoch is None:
+        os.makedirs(VERSION_DIR, exist_ok=True)
+        path = os.path.join(VERSION_DIR, "EPOCH")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            with os.fdopen(fd, "w") as f:
+                f.write(uuid.uuid4().hex[:8])
+        except FileExistsError:
+            pass
+        with open(path) as f:
+            _epoch = f.read().strip()
+    return _epoch
+
+
+def _counter_path(scope, day):
+    return os.path.join(VERSION_DIR, f"{day:%Y%m%d}-{scope}")
+
+
+def _prune_old_days(today):
+    keep = (today - datetime.timedelta(days=1)).strftime("%Y%m%d")
+    for name in os.listdir(VERSION_DIR):
+        day, _, _ = name.partition("-")
+        if day.isdigit() and day < keep:
+            try:
+                os.remove(os.path.join(VERSION_DIR, name))
+            except OSError:
+                pass
+
+
+def bump(*scopes):
+    """Increments today's counter for each scope."""
+    _get_epoch()
+    today = datetime.date.today()
+    for scope in scopes:
+        path = _counter_path(scope, today)
+        created = not os.path.exists(path)
+        with open(path, "a+") as f:
+            lock(f)
+            f.seek(0)
+            value = int(f.read() or 0) + 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(value))
+            f.flush()
+        if created:
+            _prune_old_days(today)
+
+
+def current_versions(*scopes):
+    """Today's counter for each scope (0 if never bumped)."""
+    today = datetime.date.today()
+    versions = []
+    for scope in scopes:
+        try:
+            with open(_counter_path(scope, today)) as f:
+                versions.append(int(f.read() or 0))
+        except (OSError, ValueError):
+            versions.append(0)
+    return versions
+
+
+def etag_for(*scopes):
+    """Opaque ETag value for the current state of `scopes` (plus BULK_SCOPE)."""
+    versions = current_versions(*scopes, BULK_SCOPE)
+    return f"{_get_epoch()}-{datetime.date.today():%Y%m%d}-" + ".".join(str(v) for v in versions)
+
+
+def bump_for_students(cursor, student_ids):
+    """Bumps the scopes whose dashboards show any of `student_ids`."""
+    student_ids = {int(sid) for sid in student_ids}
+    if not student_ids:
+        return
+    teachers = set(count_students_per_teacher(cursor, student_ids)) | set(unscoped_teacher_ids(cursor))
+    bump(*(f"student-{sid}" for sid in student_ids), *(f"teacher-{tid}" for tid in teachers))
+
+
+def bump_school():
+    """Invalidates every dashboard; for rare school-wide changes."""
+    bump(BULK_SCOPE)